@@ -0,0 +1,284 @@
+"""사진 폴더 / 목록 파일을 한 번에 세그멘테이션하는 오프라인 배치 CLI
+
+서버와 같은 파이프라인(decode -> smart_preprocess_image -> predict_segmentation_batch ->
+postprocess_prediction -> analyze_results)을 사용한다.
+    - 디코딩 + 전처리: 프로세스 풀 (--workers)
+    - 추론: 메인 프로세스에서 --batch-size장씩 연달아 실행 (전처리는 앞서 진행)
+    - 후처리 + 저장: 별도 스레드에서 인덱스 마스크 PNG와 results.jsonl 한 줄씩 기록
+
+results.jsonl에 성공으로 기록된 파일은 다시 실행해도 건너뛰므로 중단된 작업을 이어서 할 수 있다.
+실패한 파일은 error와 함께 기록되고 다음 실행에서 다시 시도한다.
+
+사용법:
+    python batch_segment.py --input photos/ --output relabel/
+    python batch_segment.py --manifest photos.txt --output relabel/ --batch-size 16 --workers 6
+    MODEL_BACKEND=onnx python batch_segment.py --input photos/ --output relabel/
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+import main
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+try:
+    # HEIC는 pillow-heif가 있을 때만 (없으면 PIL이 열지 못해 실행할 때마다 실패로 기록됨)
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    IMAGE_EXTENSIONS += (".heic", ".heif")
+except ImportError:
+    pass
+RESULTS_FILE = "results.jsonl"
+MASK_DIR = "masks"
+
+def list_directory(input_dir):
+    """폴더 안의 이미지 (하위 폴더 포함) - (키, 절대 경로), 키는 폴더 기준 상대 경로"""
+    items = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, name)
+                items.append((os.path.relpath(path, input_dir).replace(os.sep, "/"), os.path.abspath(path)))
+    return sorted(items)
+
+def read_manifest(manifest_path):
+    """한 줄에 경로 하나 (또는 {"path": ...} JSON) - 상대 경로는 목록 파일 위치 기준, 키는 적힌 그대로"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    items, seen = [], set()
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key = json.loads(line)["path"] if line.startswith("{") else line
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append((key, os.path.abspath(os.path.join(base_dir, key))))
+    return items
+
+def load_completed(results_path):
+    """이미 성공한 키 목록 (중단 시 잘린 마지막 줄은 무시)"""
+    completed = set()
+    if not os.path.exists(results_path):
+        return completed
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in record:
+                completed.add(record["path"])
+    return completed
+
+def mask_relpath(key):
+    """입력 키 -> masks/ 아래 상대 경로 (폴더 구조 유지, 상위 경로는 밖으로 나가지 않게 치환)
+
+    원래 확장자를 남겨 두어 (img0.jpg -> img0.jpg.png) 이름만 같은 img0.jpg / img0.png가 겹치지 않게 함
+    """
+    parts = [part if part != ".." else "__" for part in key.replace("\\", "/").split("/") if part]
+    return "/".join([MASK_DIR] + parts) + ".png"
+
+def _init_worker():
+    """전처리 워커: 입력 텐서는 CPU에 두고 (디바이스 이동은 메인 프로세스에서), 코어는 워커끼리 나눠 씀"""
+    main.device = torch.device("cpu")
+    torch.set_num_threads(1)
+
+def load_and_preprocess(key, path):
+    """워커 프로세스: 디코딩 + 전처리 -> (키, (3, H, W) float32 배열, 원본 크기, 오류)"""
+    try:
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        image, original_size = main.decode_image(image_bytes, main.MODEL_INPUT_SIZE)
+        image_tensor, _ = main.smart_preprocess_image(image)
+        return key, image_tensor.numpy()[0], original_size, None
+    except Exception as e:
+        return key, None, None, f"{type(e).__name__}: {e}"
+
+class ResultWriter(threading.Thread):
+    """후처리 + 마스크 PNG / results.jsonl 기록 (추론 루프가 기다리지 않도록 별도 스레드)"""
+
+    def __init__(self, output_dir, results_file, max_pending):
+        super().__init__(daemon=True)
+        self.output_dir = output_dir
+        self.results_file = results_file
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.succeeded = 0
+        self.failed = 0
+        self.error = None
+
+    def submit(self, item):
+        """결과 하나 넘기기 - 기록 스레드가 오류로 멈췄으면 대기하지 않고 그 오류를 다시 발생"""
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self.pending.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """남은 결과를 모두 기록하고 종료"""
+        while self.is_alive():
+            try:
+                self.pending.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self.join()
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            try:
+                self.write(*item)
+            except Exception as e:
+                # 디스크 오류 등 - 메인 루프가 확인하고 중단
+                self.error = e
+                break
+
+    def write(self, key, original_size, prediction, confidence_map, error):
+        if error is not None:
+            record = {"path": key, "error": error}
+            self.failed += 1
+        else:
+            mask = main.postprocess_prediction(prediction, confidence_map, main.CONFIDENCE_THRESHOLD)
+            stats = main.compute_class_stats(mask)
+            detected_classes, class_details = main.analyze_results(mask, stats)
+
+            # 마스크를 먼저 쓰고 나서 기록 (결과 줄이 있으면 마스크도 있음)
+            relpath = mask_relpath(key)
+            mask_path = os.path.join(self.output_dir, relpath)
+            os.makedirs(os.path.dirname(mask_path), exist_ok=True)
+            mask_bytes, _ = main.encode_mask_png(mask)
+            with open(mask_path, "wb") as f:
+                f.write(mask_bytes)
+
+            record = {
+                "path": key,
+                "mask": relpath,
+                "original_size": list(original_size),
+                "crop_box": list(main.smart_crop_box(*original_size)),
+                "detected_classes": detected_classes,
+                "class_details": class_details,
+                "class_pixels": {name: int(count) for name, count in zip(main.class_names, stats["counts"])},
+            }
+            self.succeeded += 1
+        self.results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.results_file.flush()
+
+def run_batches(items, args, writer):
+    """전처리 결과를 순서대로 받아 batch_size장씩 추론하고 writer로 넘김"""
+    context = multiprocessing.get_context("spawn")
+    # 추론이 기다리지 않도록 배치 2~3개 분량을 미리 전처리 (메모리 상한)
+    max_ahead = args.batch_size * 2 + args.workers
+    done_count = 0
+    inference_seconds = 0.0
+    started = time.perf_counter()
+    last_report = started
+
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker) as pool:
+        item_iter = iter(items)
+        in_flight = deque()
+
+        def fill():
+            while len(in_flight) < max_ahead:
+                try:
+                    key, path = next(item_iter)
+                except StopIteration:
+                    return
+                in_flight.append(pool.submit(load_and_preprocess, key, path))
+
+        fill()
+        while in_flight:
+            # 제출 순서대로 batch_size장 모으기
+            batch = []
+            while in_flight and len(batch) < args.batch_size:
+                key, array, original_size, error = in_flight.popleft().result()
+                fill()
+                if error is not None:
+                    writer.submit((key, None, None, None, error))
+                    done_count += 1
+                    continue
+                batch.append((key, array, original_size))
+            if not batch:
+                continue
+
+            inference_start = time.perf_counter()
+            image_batch = torch.from_numpy(np.stack([array for _, array, _ in batch])).to(main.device)
+            outputs = main.predict_segmentation_batch(image_batch)
+            inference_seconds += time.perf_counter() - inference_start
+
+            for (key, _, original_size), (_, prediction, confidence_map) in zip(batch, outputs):
+                writer.submit((key, original_size, prediction, confidence_map, None))
+            done_count += len(batch)
+
+            now = time.perf_counter()
+            if now - last_report >= args.report_every:
+                rate = done_count / (now - started)
+                remaining = (len(items) - done_count) / rate if rate > 0 else 0
+                print(f"⏳ {done_count}/{len(items)} ({rate:.1f} images/s, 남은 시간 {remaining:.0f}s)")
+                last_report = now
+
+    return inference_seconds
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="이미지 폴더 (하위 폴더 포함)")
+    source.add_argument("--manifest", help="이미지 경로 목록 파일 (한 줄에 하나, 또는 {\"path\": ...} JSONL)")
+    parser.add_argument("--output", required=True, help="결과 폴더 (masks/, results.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=main.MAX_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="디코딩/전처리 프로세스 수")
+    parser.add_argument("--limit", type=int, help="앞에서부터 N장만 처리 (시험 실행)")
+    parser.add_argument("--report-every", type=float, default=10.0, help="진행 상황 출력 간격 (초)")
+    args = parser.parse_args()
+
+    items = list_directory(args.input) if args.input else read_manifest(args.manifest)
+    os.makedirs(args.output, exist_ok=True)
+    results_path = os.path.join(args.output, RESULTS_FILE)
+    completed = load_completed(results_path)
+    todo = [item for item in items if item[0] not in completed]
+    skipped = len(items) - len(todo)
+    if args.limit:
+        todo = todo[:args.limit]
+    print(f"📂 이미지 {len(items)}장 - 이미 완료된 {skipped}장 건너뜀, {len(todo)}장 처리")
+    if not todo:
+        return
+
+    if main.ensure_model_loaded() is None:
+        sys.exit(1)
+
+    started = time.perf_counter()
+    with open(results_path, "a", encoding="utf-8") as results_file:
+        writer = ResultWriter(args.output, results_file, max_pending=args.batch_size * 4)
+        writer.start()
+        try:
+            inference_seconds = run_batches(todo, args, writer)
+        finally:
+            writer.close()
+    elapsed = time.perf_counter() - started
+
+    if writer.error is not None:
+        print(f"❌ 결과 기록 실패: {writer.error}")
+        sys.exit(1)
+    print(f"\n✅ 완료: {writer.succeeded}장 성공, {writer.failed}장 실패, {elapsed:.1f}s")
+    print(f"   처리량: {writer.succeeded / elapsed:.2f} images/s (추론 {inference_seconds:.1f}s, {inference_seconds / elapsed:.0%})")
+    print(f"💾 결과: {results_path}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,284 @@
+"""세그멘테이션 파이프라인 오프라인 벤치마크 - weights.pt / 서버 없이 단계별 + 전체 성능 측정
+
+대체 모델(7클래스, 512x512 logits)과 스마트폰 해상도의 합성 JPEG로 각 단계 함수와
+process_segmentation() / run_pipeline()을 따로 실행해 처리량, p50/p95/p99 지연,
+할당량(tracemalloc 최대치), 최대 RSS를 JSON으로 남긴다. 해상도마다 새 프로세스에서 측정한다.
+측정 전에 프로세스 워커에서 난 마감 시간 초과/파이프라인 오류가 그대로 전달되고 풀이 계속
+동작하는지 확인한다 (EXECUTION_BACKEND=process와 같은 spawn 풀, 실패하면 종료 코드 1).
+
+사용법:
+    python benchmarks/bench_pipeline.py --output results/baseline.json
+    python benchmarks/bench_pipeline.py --resolutions 1080p 12mp --repeat 10
+    python benchmarks/bench_pipeline.py --output results/new.json --compare results/baseline.json --tolerance 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import main  # noqa: E402
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "12mp": (4032, 3024),
+    "48mp": (8000, 6000),
+}
+
+class StandInSegmenter(nn.Module):
+    """실제 모델과 같은 출력 형태({"logits": (N, 7, 512, 512)})의 가벼운 대체 모델
+
+    색상 기반 1x1 conv + 평균 풀링으로 부드러운 영역을 만들어 후처리/시각화가
+    실제와 비슷한 크기의 연결 영역을 다루도록 한다. 추론 단계 시간은 실제 모델과 다르다.
+    """
+
+    def __init__(self, num_classes=len(main.class_names), seed=0):
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        self.classifier = nn.Conv2d(3, num_classes, 1)
+        with torch.no_grad():
+            self.classifier.weight.copy_(torch.randn(self.classifier.weight.shape, generator=generator) * 4)
+            self.classifier.bias.copy_(torch.randn(self.classifier.bias.shape, generator=generator))
+
+    def forward(self, image_batch):
+        logits = self.classifier(image_batch)
+        return {"logits": F.avg_pool2d(logits, kernel_size=9, stride=1, padding=4)}
+
+def make_phone_jpeg(width, height, seed=0):
+    """물체(타원) 몇 개 + 그라디언트 배경 + 센서 노이즈가 있는 합성 스마트폰 사진"""
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(0, 160, width, dtype=np.float32)
+    ys = np.linspace(0, 120, height, dtype=np.float32)
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = (xs[None, :] + ys[:, None]).astype(np.uint8)
+    pixels[..., 1] = (ys[:, None] + 60).astype(np.uint8)
+    pixels[..., 2] = (200 - xs[None, :]).astype(np.uint8)
+
+    scale = max(width, height) / 1000
+    for _ in range(8):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(40, 220) * scale), int(rng.integers(40, 220) * scale))
+        color = tuple(int(v) for v in rng.integers(0, 256, size=3))
+        cv2.ellipse(pixels, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+
+    noise = rng.integers(-8, 9, size=pixels.shape, dtype=np.int16)
+    pixels = np.clip(pixels + noise, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def build_stages(image_bytes):
+    """단계 이름 -> 인자 없는 callable (각 단계 입력은 미리 한 번 만들어 둠)"""
+    image, _ = main.decode_image(image_bytes, main.MODEL_INPUT_SIZE)
+    display_image, _ = main.decode_image(image_bytes, main.MAX_DISPLAY_SIZE)
+    image_tensor, _ = main.smart_preprocess_image(image)
+    _, prediction, confidence_map = main.predict_segmentation(image_tensor)
+    mask = main.postprocess_prediction(prediction, confidence_map, main.CONFIDENCE_THRESHOLD)
+    stats = main.compute_class_stats(mask)
+    predict_img, _ = main.create_visualization(display_image, mask, stats=stats)
+
+    def analyze():
+        main.analyze_results(mask, main.compute_class_stats(mask))
+
+    return {
+        "decode": lambda: main.decode_image(image_bytes, main.MODEL_INPUT_SIZE),
+        "decode_display": lambda: main.decode_image(image_bytes, main.MAX_DISPLAY_SIZE),
+        "preprocess": lambda: main.smart_preprocess_image(image),
+        "inference": lambda: main.predict_segmentation(image_tensor),
+        "postprocess": lambda: main.postprocess_prediction(prediction, confidence_map, main.CONFIDENCE_THRESHOLD),
+        "analyze": analyze,
+        "render": lambda: main.create_visualization(display_image, mask, stats=stats),
+        "encode_png": lambda: main.encode_image(predict_img, "png"),
+        "encode_mask": lambda: main.encode_mask_png(mask),
+        "process_segmentation": lambda: main.process_segmentation(image_bytes),
+        "run_pipeline": lambda: main.run_pipeline(image_bytes),
+    }
+
+def measure(func, repeat, warmup):
+    """지연 분포 + tracemalloc 최대 할당량 (할당 측정은 별도 1회 실행 - 지연 측정에 영향 없음)"""
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+
+    tracemalloc.start()
+    func()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+        "throughput_per_s": float(1000.0 / latencies.mean()),
+        "alloc_peak_bytes": int(alloc_peak),
+    }
+
+def run_resolution(name, repeat, warmup):
+    """새 프로세스에서 실행 - 해상도 하나의 모든 단계 측정"""
+    width, height = RESOLUTIONS[name]
+    main.use_model(StandInSegmenter().eval())
+    main.ENABLE_MICRO_BATCHING = False
+    image_bytes = make_phone_jpeg(width, height)
+
+    results = {}
+    # main 쪽 남은 출력이 측정을 방해하지 않도록 제외
+    with contextlib.redirect_stdout(io.StringIO()):
+        stages = build_stages(image_bytes)
+        for stage, func in stages.items():
+            results[stage] = measure(func, repeat, warmup)
+
+    return {
+        "input": {"width": width, "height": height, "jpeg_bytes": len(image_bytes)},
+        "peak_rss_bytes": main.peak_rss_bytes(),
+        "stages": results,
+    }
+
+def raise_pipeline_error():
+    raise main.PipelineError(500, "check")
+
+def check_process_errors():
+    """spawn 워커에서 난 DeadlineExceeded / PipelineError 확인 - 문제 목록 (없으면 빈 리스트)
+
+    예외가 unpickle되지 않으면 풀 전체가 BrokenProcessPool이 되어 이후 요청이 모두 실패한다.
+    """
+    failures = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        cases = [
+            ("deadline", pool.submit(main.check_deadline, 0.0), main.DeadlineExceeded, 504),
+            ("pipeline_error", pool.submit(raise_pipeline_error), main.PipelineError, 500),
+        ]
+        for name, future, error_type, status_code in cases:
+            try:
+                future.result()
+                failures.append(f"{name}: 예외가 발생하지 않음")
+            except error_type as e:
+                if e.status_code != status_code:
+                    failures.append(f"{name}: status_code {e.status_code} != {status_code}")
+            except Exception as e:
+                failures.append(f"{name}: {type(e).__name__}: {e}")
+
+        # 오류 뒤에도 같은 풀에서 다음 작업이 실행되어야 함
+        try:
+            pool.submit(os.getpid).result()
+        except Exception as e:
+            failures.append(f"pool: {type(e).__name__}: {e}")
+    return failures
+
+def environment_info(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "model": "StandInSegmenter",
+    }
+
+def compare_results(current, baseline, tolerance):
+    """baseline 대비 p50이 tolerance 비율 이상 느려진 단계 목록"""
+    regressions = []
+    for resolution, result in current["results"].items():
+        base_stages = baseline.get("results", {}).get(resolution, {}).get("stages", {})
+        for stage, stats in result["stages"].items():
+            base = base_stages.get(stage)
+            if base is None:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"] if base["p50_ms"] > 0 else 1.0
+            if ratio > 1.0 + tolerance:
+                regressions.append((resolution, stage, base["p50_ms"], stats["p50_ms"], ratio))
+    return regressions
+
+def print_results(report):
+    for resolution, result in report["results"].items():
+        info = result["input"]
+        print(f"\n📷 {resolution} ({info['width']}x{info['height']}, {info['jpeg_bytes']:,} bytes) - 최대 RSS {result['peak_rss_bytes'] / 1e6:.0f}MB")
+        print(f"   {'stage':<22} {'p50':>9} {'p95':>9} {'p99':>9} {'ops/s':>8} {'alloc peak':>11}")
+        for stage, stats in result["stages"].items():
+            print(
+                f"   {stage:<22} {stats['p50_ms']:>7.1f}ms {stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms "
+                f"{stats['throughput_per_s']:>8.1f} {stats['alloc_peak_bytes'] / 1e6:>9.1f}MB"
+            )
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", help="결과 JSON 경로")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON (p50 회귀 확인)")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="허용 p50 증가 비율")
+    args = parser.parse_args()
+
+    failures = check_process_errors()
+    if failures:
+        print("❌ 프로세스 워커 오류 전달 실패")
+        for failure in failures:
+            print(f"   {failure}")
+        sys.exit(1)
+    print("✅ 프로세스 워커 오류 전달 확인")
+
+    report = {"environment": environment_info(args), "results": {}}
+    context = multiprocessing.get_context("spawn")
+    for name in args.resolutions:
+        print(f"⏱️ {name} 측정 중...")
+        # 해상도마다 새 프로세스 (최대 RSS가 이전 해상도의 영향을 받지 않도록)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            report["results"][name] = pool.submit(run_resolution, name, args.repeat, args.warmup).result()
+
+    print_results(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 결과 저장: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ p50 회귀 {len(regressions)}건 (허용 {args.tolerance:.0%})")
+            for resolution, stage, before, after, ratio in regressions:
+                print(f"   {resolution:<6} {stage:<22} {before:>7.1f}ms -> {after:>7.1f}ms ({ratio:.2f}x)")
+            sys.exit(1)
+        print(f"\n✅ 회귀 없음 (허용 {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,130 @@
+"""postprocess_prediction() 벤치마크 - 기존 클래스별 루프 vs 라벨 맵 단일 패스
+
+측정 전에 기존 구현과 결과가 픽셀 단위로 같은지 확인한다 (다른 클래스와 맞닿은 영역 포함).
+다르면 종료 코드 1.
+
+사용법:
+    python benchmarks/bench_postprocess.py --repeat 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import main  # noqa: E402
+
+SIZES = {
+    "512x512": (512, 512),
+    "phone_12mp": (3024, 4032),  # (height, width)
+}
+
+def postprocess_prediction_legacy(prediction, confidence_map, confidence_threshold=0.3):
+    """기존 구현 (클래스마다 전체 마스크 opening + 클래스 전체 면적으로 판단)"""
+    mask = np.where(confidence_map >= confidence_threshold, prediction, 0)
+    cleaned_mask = np.zeros_like(mask)
+
+    for class_id in range(1, len(main.class_names)):
+        class_mask = (mask == class_id).astype(np.uint8)
+
+        if np.sum(class_mask) == 0:
+            continue
+
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        opened = cv2.morphologyEx(class_mask, cv2.MORPH_OPEN, kernel)
+
+        if np.sum(opened) >= 50:
+            cleaned_mask[opened > 0] = class_id
+
+    return cleaned_mask
+
+def make_touching_classes_case():
+    """큰 can 영역 - glass 영역 - 작은 can 조각(25px)이 이어져 있는 경우"""
+    prediction = np.zeros((64, 64), dtype=np.int64)
+    prediction[4:40, 4:24] = 1    # 큰 can
+    prediction[4:40, 24:44] = 2   # can과 맞닿은 glass
+    prediction[10:15, 44:49] = 1  # glass에만 닿은 작은 can (5x5)
+    confidence_map = np.ones(prediction.shape, dtype=np.float32)
+    return prediction, confidence_map
+
+def check_correctness(num_random=30):
+    """기존 구현과 다른 경우 목록 (이름, 다른 픽셀 수)"""
+    cases = [("touching_classes", *make_touching_classes_case())]
+    for seed in range(num_random):
+        cases.append((f"random_{seed}", *make_synthetic_prediction(256, 256, seed=seed)))
+
+    mismatches = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, prediction, confidence_map in cases:
+            expected = postprocess_prediction_legacy(prediction, confidence_map)
+            actual = main.postprocess_prediction(prediction, confidence_map)
+            diff = int(np.count_nonzero(expected != actual))
+            if diff:
+                mismatches.append((name, diff))
+    return len(cases), mismatches
+
+def make_synthetic_prediction(height, width, seed=0):
+    """큰 물체 몇 개 + 작은 노이즈 영역이 섞인 가짜 예측 결과 (np.argmax 출력과 같은 int64)"""
+    rng = np.random.default_rng(seed)
+    num_classes = len(main.class_names)
+    scale = max(height, width) / 512
+
+    prediction = np.zeros((height, width), dtype=np.uint8)
+    for _ in range(6):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(30, 120) * scale), int(rng.integers(30, 120) * scale))
+        cv2.ellipse(prediction, center, axes, float(rng.integers(0, 180)), 0, 360, int(rng.integers(1, num_classes)), -1)
+    for _ in range(300):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(prediction, center, int(rng.integers(1, 6) * scale), int(rng.integers(1, num_classes)), -1)
+
+    noise = rng.random((height, width)) < 0.002
+    prediction[noise] = rng.integers(0, num_classes, size=int(noise.sum()), dtype=np.uint8)
+
+    confidence_map = rng.uniform(0.25, 1.0, size=(height, width)).astype(np.float32)
+    return prediction.astype(np.int64), confidence_map
+
+def time_it(func, args, repeat):
+    timings = []
+    for _ in range(repeat):
+        # main 쪽 print 비용은 두 구현 모두에서 제외
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func(*args)
+            timings.append(time.perf_counter() - start)
+    return result, np.array(timings) * 1000.0
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    num_cases, mismatches = check_correctness()
+    if mismatches:
+        print(f"❌ 기존 구현과 다른 결과 {len(mismatches)}/{num_cases}건")
+        for name, diff in mismatches:
+            print(f"   {name}: {diff} px")
+        sys.exit(1)
+    print(f"✅ 기존 구현과 결과 일치 ({num_cases}건)\n")
+
+    print(f"{'size':<12} {'legacy p50':>12} {'new p50':>12} {'speedup':>9} {'agreement':>10}")
+    for name, (height, width) in SIZES.items():
+        prediction, confidence_map = make_synthetic_prediction(height, width)
+
+        legacy_mask, legacy_ms = time_it(postprocess_prediction_legacy, (prediction, confidence_map), args.repeat)
+        new_mask, new_ms = time_it(main.postprocess_prediction, (prediction, confidence_map), args.repeat)
+
+        agreement = float(np.mean(legacy_mask == new_mask)) * 100
+        speedup = np.median(legacy_ms) / np.median(new_ms)
+        print(
+            f"{name:<12} {np.median(legacy_ms):>10.1f}ms {np.median(new_ms):>10.1f}ms "
+            f"{speedup:>8.1f}x {agreement:>9.2f}%"
+        )
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,110 @@
+"""전처리 벤치마크 - 기존 (전체 디코딩 + 2단계 LANCZOS + ImageEnhance 3회) vs 빠른 경로
+
+사용법:
+    python benchmarks/bench_preprocess.py photos/*.jpg --repeat 5
+    python benchmarks/bench_preprocess.py            # 사진이 없으면 12MP 합성 JPEG 사용
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import main  # noqa: E402
+
+def preprocess_legacy(image_bytes, target_size=main.MODEL_INPUT_SIZE):
+    """기존 구현 - 단계별 시간과 함께 텐서 반환"""
+    timings = {}
+    start = time.perf_counter()
+
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    timings["decode"] = time.perf_counter() - start
+
+    stage = time.perf_counter()
+    width, height = image.size
+    if max(width, height) > 2048:
+        scale = 2048 / max(width, height)
+        image = image.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+    cropped = image.crop(main.smart_crop_box(*image.size))
+    resized = cropped.resize((target_size, target_size), Image.Resampling.LANCZOS)
+    timings["crop_resize"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    enhanced = ImageEnhance.Contrast(resized).enhance(1.2)
+    enhanced = ImageEnhance.Sharpness(enhanced).enhance(1.1)
+    enhanced = ImageEnhance.Color(enhanced).enhance(1.1)
+    img_array = np.array(enhanced).astype(np.float32) / 255.0
+    tensor = torch.from_numpy(img_array).permute(2, 0, 1).unsqueeze(0)
+    timings["enhance"] = time.perf_counter() - stage
+
+    return tensor, timings
+
+def preprocess_fast(image_bytes, target_size=main.MODEL_INPUT_SIZE):
+    """main.py 경로 (draft 디코딩 + 단일 리사이즈 + fused 보정)"""
+    timings = {}
+    start = time.perf_counter()
+
+    image, _ = main.decode_image(image_bytes, target_size)
+    timings["decode"] = time.perf_counter() - start
+
+    tensor, _ = main.smart_preprocess_image(image, target_size, timings=timings)
+    return tensor, timings
+
+def make_synthetic_jpeg(width=4032, height=3024, seed=0):
+    """부드러운 그라디언트 + 노이즈가 섞인 12MP 합성 사진"""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([xs / width, ys / height, (xs + ys) / (width + height)], axis=-1) * 200
+    noise = rng.normal(0, 12, size=(height, width, 3))
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+def run(func, image_bytes, repeat):
+    totals, stages = [], {}
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            tensor, timings = func(image_bytes)
+            totals.append(time.perf_counter() - start)
+        for name, value in timings.items():
+            stages.setdefault(name, []).append(value)
+    summary = {name: np.median(values) * 1000 for name, values in stages.items()}
+    summary["total"] = np.median(totals) * 1000
+    return tensor, summary
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("photos", nargs="*", help="스마트폰 사진 경로 (glob 가능)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.photos for path in sorted(glob.glob(pattern))]
+    if paths:
+        inputs = [(os.path.basename(path), open(path, "rb").read()) for path in paths]
+    else:
+        inputs = [("synthetic_12mp.jpg", make_synthetic_jpeg())]
+
+    stage_names = ["decode", "crop_resize", "enhance", "to_device", "total"]
+    for name, image_bytes in inputs:
+        legacy_tensor, legacy = run(preprocess_legacy, image_bytes, args.repeat)
+        fast_tensor, fast = run(preprocess_fast, image_bytes, args.repeat)
+        max_diff = float((legacy_tensor - fast_tensor.cpu()).abs().max()) * 255
+
+        print(f"\n{name} ({len(image_bytes):,} bytes) - 최대 픽셀 차이 {max_diff:.1f}/255")
+        print(f"   {'stage':<12} {'legacy':>10} {'fast':>10}")
+        for stage in stage_names:
+            print(f"   {stage:<12} {legacy.get(stage, 0.0):>8.1f}ms {fast.get(stage, 0.0):>8.1f}ms")
+        print(f"   speedup: {legacy['total'] / fast['total']:.1f}x")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,133 @@
+"""weights.pt -> TorchScript / ONNX 변환 + 백엔드 간 마스크 일치 확인
+
+사용법:
+    python export_model.py                              # TorchScript + ONNX 생성 후 parity 확인
+    python export_model.py --formats onnx
+    python export_model.py --check-only --images samples/*.jpg --tolerance 0.999
+
+서버에서는 MODEL_BACKEND=eager|torchscript|onnx 로 선택한다.
+"""
+import argparse
+import glob
+import sys
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import main
+
+class LogitsOnly(nn.Module):
+    """모델 출력(dict/tensor)에서 logits 텐서만 반환하는 래퍼 (trace/export용)"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, image_batch):
+        return main.extract_logits(self.model(image_batch))
+
+def export_torchscript(model, path, example):
+    """trace -> freeze 후 저장 (optimize_for_inference는 main.load_model에서 적용)"""
+    with torch.inference_mode():
+        traced = torch.jit.trace(LogitsOnly(model).eval(), example, strict=False)
+    frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+    print(f"✅ TorchScript 저장: {path}")
+
+def export_onnx(model, path, example, opset):
+    """배치 차원을 동적으로 둔 ONNX 저장"""
+    torch.onnx.export(
+        LogitsOnly(model).eval(),
+        example,
+        path,
+        input_names=["image"],
+        output_names=["logits"],
+        dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+    )
+    print(f"✅ ONNX 저장: {path}")
+
+def load_inputs(image_patterns, count):
+    """parity 확인용 입력 - 샘플 사진이 있으면 서버와 같은 전처리, 없으면 고정 시드 랜덤"""
+    paths = [path for pattern in image_patterns for path in sorted(glob.glob(pattern))]
+    if paths:
+        inputs = []
+        for path in paths[:count]:
+            with open(path, "rb") as f:
+                image, _ = main.decode_image(f.read())
+            tensor, _ = main.smart_preprocess_image(image)
+            inputs.append(tensor.cpu())
+        return inputs
+
+    generator = torch.Generator().manual_seed(0)
+    size = main.MODEL_INPUT_SIZE
+    return [torch.rand((1, 3, size, size), generator=generator) for _ in range(count)]
+
+def run_logits(model, inputs):
+    outputs = []
+    with torch.inference_mode():
+        for tensor in inputs:
+            if isinstance(model, nn.Module):
+                tensor = tensor.to(next(iter(model.parameters()), torch.empty(0)).device)
+            outputs.append(main.extract_logits(model(tensor)).float().cpu())
+    return outputs
+
+def check_parity(backends, inputs, tolerance):
+    """eager 기준으로 백엔드별 마스크(argmax) 일치율과 logits 최대 오차 비교"""
+    reference_model = main.load_model("eager")
+    if reference_model is None:
+        print("❌ eager 모델을 불러올 수 없어 parity 확인을 건너뜁니다")
+        return False
+    reference = run_logits(reference_model, inputs)
+
+    passed = True
+    print(f"\n{'backend':<12} {'mask agreement':>15} {'max |logit diff|':>17}")
+    for backend in backends:
+        model = main.load_model(backend)
+        if model is None:
+            print(f"{backend:<12} {'로드 실패':>15}")
+            passed = False
+            continue
+
+        outputs = run_logits(model, inputs)
+        agreement = np.mean([
+            (out.argmax(dim=1) == ref.argmax(dim=1)).float().mean().item()
+            for out, ref in zip(outputs, reference)
+        ])
+        max_diff = max((out - ref).abs().max().item() for out, ref in zip(outputs, reference))
+        status = "✅" if agreement >= tolerance else "❌"
+        print(f"{backend:<12} {agreement:>14.4%} {max_diff:>17.5f} {status}")
+        passed = passed and agreement >= tolerance
+
+    return passed
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--formats", nargs="+", default=["torchscript", "onnx"], choices=["torchscript", "onnx"])
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--check-only", action="store_true", help="변환 없이 parity 확인만")
+    parser.add_argument("--images", nargs="*", default=[], help="parity 확인용 샘플 사진 (glob 가능)")
+    parser.add_argument("--samples", type=int, default=4)
+    parser.add_argument("--tolerance", type=float, default=0.999, help="eager 대비 최소 마스크 일치율")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        model = main.load_model("eager")
+        if model is None:
+            sys.exit(1)
+        model = model.cpu().eval()
+        size = main.MODEL_INPUT_SIZE
+        example = torch.rand((1, 3, size, size))
+
+        if "torchscript" in args.formats:
+            export_torchscript(model, main.TORCHSCRIPT_PATH, example)
+        if "onnx" in args.formats:
+            export_onnx(model, main.ONNX_PATH, example, args.opset)
+
+    inputs = load_inputs(args.images, args.samples)
+    if not check_parity(args.formats, inputs, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,6 +1,9 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
+from fastapi.responses import Response, JSONResponse
+from collections import OrderedDict
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -11,6 +14,21 @@ import os
 import uvicorn
 import base64
 import time
+import queue
+import threading
+import asyncio
+import multiprocessing
+import math
+import functools
+import json
+import uuid
+import hashlib
+import bisect
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 # ===== FastAPI 앱 생성 =====
 app = FastAPI(title="Real-time Recycling Segmentation API")
@@ -35,46 +53,182 @@ async def root():
 async def health():
     return {"status": "healthy", "gpu_available": torch.cuda.is_available()}
 
+@app.get("/ready")
+async def ready():
+    """모델 로드 + 워밍업이 끝나야 200 (/health는 프로세스 생존 여부만 확인)"""
+    if startup_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": startup_error, "timings": STARTUP_TIMINGS})
+    if not ready_event.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up", "timings": STARTUP_TIMINGS})
+    return {"status": "ready", "backend": MODEL_BACKEND, "execution_backend": EXECUTION_BACKEND, "timings": STARTUP_TIMINGS}
+
 # ===== 모델 관련 설정 =====
 # weights.pt 파일에서 직접 모델 로드
+# MODEL_BACKEND로 추론 엔진 선택 (export_model.py로 TorchScript/ONNX 파일 생성)
+# - eager: torch.load로 불러온 원본 모델
+# - torchscript: freeze 된 TorchScript (로드 시 optimize_for_inference 적용)
+# - onnx: ONNX Runtime 세션
+# - int8: quantize_model.py로 만든 int8 양자화 TorchScript (CPU 전용)
+WEIGHTS_PATH = os.environ.get("WEIGHTS_PATH", os.path.join(os.path.dirname(__file__), "weights.pt"))
+TORCHSCRIPT_PATH = os.environ.get("TORCHSCRIPT_PATH", os.path.splitext(WEIGHTS_PATH)[0] + ".torchscript.pt")
+ONNX_PATH = os.environ.get("ONNX_PATH", os.path.splitext(WEIGHTS_PATH)[0] + ".onnx")
+QUANTIZED_PATH = os.environ.get("QUANTIZED_PATH", os.path.splitext(WEIGHTS_PATH)[0] + ".int8.pt")
+
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "eager")
+INTRA_OP_THREADS = int(os.environ.get("INTRA_OP_THREADS", "0"))  # 0이면 라이브러리 기본값
+INTER_OP_THREADS = int(os.environ.get("INTER_OP_THREADS", "0"))
+CHANNELS_LAST = os.environ.get("CHANNELS_LAST", "0") == "1"
+# eager 가중치를 mmap으로 로드 (같은 호스트의 프로세스끼리 페이지 캐시 공유, 읽은 만큼만 메모리 사용)
+WEIGHTS_MMAP = os.environ.get("WEIGHTS_MMAP", "1") == "1"
+# 서버 시작 시 더미 512x512 입력으로 전체 파이프라인을 돌리는 횟수 (0이면 생략)
+WARMUP_ITERATIONS = int(os.environ.get("WARMUP_ITERATIONS", "2"))
 
 # ===== 모델 로드 =====
-WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "weights.pt")
 
-try:
-    print("🤖 PyTorch 모델 로드 중...")
-    
-    if not os.path.exists(WEIGHTS_PATH):
-        raise FileNotFoundError(f"weights.pt 파일을 찾을 수 없습니다: {WEIGHTS_PATH}")
-    
-    # 모델 직접 로드 (완전한 모델이 저장된 경우)
-    model = torch.load(WEIGHTS_PATH, map_location='cpu')
-    print(f"✅ 모델 파일 로드 완료!")
-    
-    # 모델 타입 확인
-    print(f"   모델 타입: {type(model)}")
-    
-    # 평가 모드로 설정
-    model.eval()
-    
-    # GPU 최적화
-    if torch.cuda.is_available():
-        model = model.cuda()
-        print("✅ GPU 최적화 완료!")
-    else:
-        print("⚠️ CPU 모드로 실행")
+class OnnxRuntimeModel:
+    """ONNX Runtime 세션을 torch 모델처럼 호출하기 위한 래퍼 (model(tensor) -> logits tensor)"""
+
+    def __init__(self, path, intra_op_threads=0, inter_op_threads=0):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads > 0:
+            options.inter_op_num_threads = inter_op_threads
+        
+        providers = ["CPUExecutionProvider"]
+        if "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        
+        self.session = ort.InferenceSession(path, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, image_batch):
+        logits = self.session.run(None, {self.input_name: image_batch.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+def resolve_intra_op_threads():
+    """intra-op 스레드 수 (프로세스 워커끼리는 코어를 나눠 씀)"""
+    if INTRA_OP_THREADS > 0:
+        return INTRA_OP_THREADS
+    if EXECUTION_BACKEND == "process":
+        return max(1, (os.cpu_count() or 1) // WORKER_COUNT)
+    return 0
+
+def configure_torch_threads():
+    intra_op_threads = resolve_intra_op_threads()
+    if intra_op_threads > 0:
+        torch.set_num_threads(intra_op_threads)
+    if INTER_OP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(INTER_OP_THREADS)
+        except RuntimeError:
+            # inter-op 스레드 풀이 이미 시작된 경우 변경 불가
+            pass
+
+def select_quantized_engine():
+    """양자화 커널 엔진 선택 (x86 > fbgemm > qnnpack) - 양자화할 때와 같은 엔진을 써야 함"""
+    supported = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in supported:
+            torch.backends.quantized.engine = engine
+            return engine
+    return torch.backends.quantized.engine
+
+def load_weights(path):
+    """weights.pt 로드 - 가능하면 mmap (구 포맷으로 저장된 파일은 일반 로드로 대체)"""
+    if WEIGHTS_MMAP:
+        try:
+            return torch.load(path, map_location='cpu', weights_only=False, mmap=True)
+        except RuntimeError as e:
+            print(f"⚠️ mmap 로드 불가 - 일반 로드로 대체: {e}")
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+def load_model(backend=None):
+    """MODEL_BACKEND에 맞는 모델 로드 (실패 시 None)"""
+    backend = backend or MODEL_BACKEND
     
-    print("✅ 모델 로드 완료!")
+    try:
+        print(f"🤖 모델 로드 중... (backend: {backend})")
+        configure_torch_threads()
+        
+        if backend == "onnx":
+            if not os.path.exists(ONNX_PATH):
+                raise FileNotFoundError(f"ONNX 파일을 찾을 수 없습니다: {ONNX_PATH} (export_model.py로 생성)")
+            model = OnnxRuntimeModel(ONNX_PATH, resolve_intra_op_threads(), INTER_OP_THREADS)
+            print(f"✅ ONNX Runtime 세션 생성 완료! (providers: {model.session.get_providers()})")
+            return model
+        
+        if backend == "torchscript":
+            if not os.path.exists(TORCHSCRIPT_PATH):
+                raise FileNotFoundError(f"TorchScript 파일을 찾을 수 없습니다: {TORCHSCRIPT_PATH} (export_model.py로 생성)")
+            model = torch.jit.load(TORCHSCRIPT_PATH, map_location=device)
+            # optimize_for_inference 결과는 저장/재로드가 안 되므로 로드한 뒤 적용
+            model = torch.jit.optimize_for_inference(model)
+            print("✅ TorchScript 모델 로드 완료!")
+        elif backend == "int8":
+            if not os.path.exists(QUANTIZED_PATH):
+                raise FileNotFoundError(f"int8 모델을 찾을 수 없습니다: {QUANTIZED_PATH} (quantize_model.py로 생성)")
+            select_quantized_engine()
+            # 양자화 커널은 CPU 전용
+            model = torch.jit.load(QUANTIZED_PATH, map_location='cpu')
+            print(f"✅ int8 양자화 모델 로드 완료! (engine: {torch.backends.quantized.engine})")
+        elif backend == "eager":
+            if not os.path.exists(WEIGHTS_PATH):
+                raise FileNotFoundError(f"weights.pt 파일을 찾을 수 없습니다: {WEIGHTS_PATH}")
+        
+            # 모델 직접 로드 (완전한 모델이 저장된 경우)
+            model = load_weights(WEIGHTS_PATH)
+            print("✅ 모델 파일 로드 완료!")
+        else:
+            raise ValueError(f"알 수 없는 MODEL_BACKEND: {backend}")
+        
+        # 모델 타입 확인
+        print(f"   모델 타입: {type(model)}")
+        
+        # 평가 모드로 설정
+        model.eval()
+        
+        # GPU 최적화
+        if torch.cuda.is_available() and backend != "int8":
+            model = model.cuda()
+            print("✅ GPU 최적화 완료!")
+        else:
+            print("⚠️ CPU 모드로 실행")
+        
+        if CHANNELS_LAST:
+            model = model.to(memory_format=torch.channels_last)
+        
+        print("✅ 모델 로드 완료!")
+        return model
     
-except Exception as e:
-    print(f"❌ 모델 로드 실패: {e}")
-    print("💡 가능한 해결책:")
-    print("   1. weights.pt 파일이 올바른 위치에 있는지 확인")
-    print("   2. PyTorch 버전 호환성 확인")
-    print("   3. 파일이 손상되지 않았는지 확인")
-    model = None
+    except Exception as e:
+        print(f"❌ 모델 로드 실패: {e}")
+        print("💡 가능한 해결책:")
+        print("   1. weights.pt 파일이 올바른 위치에 있는지 확인")
+        print("   2. PyTorch 버전 호환성 확인")
+        print("   3. 파일이 손상되지 않았는지 확인")
+        return None
+
+def get_model_version():
+    """캐시 키용 모델 식별자 (백엔드 + 가중치 파일 크기/수정 시각)"""
+    path = {"onnx": ONNX_PATH, "torchscript": TORCHSCRIPT_PATH, "int8": QUANTIZED_PATH}.get(MODEL_BACKEND, WEIGHTS_PATH)
+    try:
+        stat = os.stat(path)
+        return f"{MODEL_BACKEND}-{stat.st_size}-{int(stat.st_mtime)}"
+    except OSError:
+        return f"{MODEL_BACKEND}-unknown"
 
 # ===== 설정 =====
+# int8 양자화 모델은 CPU에서만 실행되므로 입력 텐서도 CPU에 둔다
+device = torch.device("cuda" if torch.cuda.is_available() and MODEL_BACKEND != "int8" else "cpu")
+print(f"🔧 디바이스: {device}")
+
 class_names = ["background", "can", "glass", "paper", "plastic", "styrofoam", "vinyl"]
 
 class_colors_bright = [
@@ -87,36 +241,279 @@ class_colors_bright = [
     (138, 43, 226)    # vinyl - 바이올렛
 ]
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"🔧 디바이스: {device}")
-
 font_path = os.path.join(os.path.dirname(__file__), "Pretendard-SemiBold.otf")
 
 # 실시간 처리를 위한 설정
 MODEL_INPUT_SIZE = 512  # 모델이 요구하는 크기에 맞게 조정
-PROCESSING_TIMEOUT = 10.0  # 스마트폰 고해상도 이미지 처리 시간 고려
+MAX_DISPLAY_SIZE = int(os.environ.get("MAX_DISPLAY_SIZE", "1024"))  # 결과 이미지 최대 해상도
+CONFIDENCE_THRESHOLD = 0.3  # 후처리 신뢰도 기준
+PROCESSING_TIMEOUT = float(os.environ.get("PROCESSING_TIMEOUT", "10.0"))  # 스마트폰 고해상도 이미지 처리 시간 고려
+
+# 마이크로 배칭 설정 (동시에 들어온 요청을 한 번의 model() 호출로 묶음)
+ENABLE_MICRO_BATCHING = os.environ.get("ENABLE_MICRO_BATCHING", "1") == "1"
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.environ.get("MAX_BATCH_WAIT_MS", "10"))
+
+# 실행 백엔드 설정 (블로킹 파이프라인을 이벤트 루프 밖의 워커 풀에서 실행)
+# - thread: 스레드풀 (모델 1개 공유, 마이크로 배칭과 함께 사용)
+# - process: 프로세스풀 (워커마다 모델을 한 번씩 로드)
+EXECUTION_BACKEND = os.environ.get("EXECUTION_BACKEND", "thread")
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", str(os.cpu_count() or 1)))
+
+# 과부하 제어 설정 (처리 중 + 대기 요청 수 제한, 초과 시 503/429 + Retry-After)
+MAX_QUEUE_SIZE = int(os.environ.get("MAX_QUEUE_SIZE", str(WORKER_COUNT * 2)))
+MAX_INFLIGHT_PER_CLIENT = int(os.environ.get("MAX_INFLIGHT_PER_CLIENT", "2"))
+
+# 결과 캐시 설정 (같은 사진 재업로드 시 파이프라인 생략, RESULT_CACHE_DIR를 지정하면 디스크 캐시도 사용)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR")
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# ===== 모델 지연 로드 + 시작 시간 기록 =====
+# import 시점에는 모델을 올리지 않고, 서버 startup(프로세스 워커는 initializer)에서 로드 + 워밍업한다.
+# 스크립트에서 main의 함수를 직접 쓸 때는 ensure_model_loaded()가 처음 호출될 때 로드된다.
+
+model = None
+MODEL_VERSION = get_model_version()
+
+_model_lock = threading.Lock()
+_model_load_attempted = False
+
+STARTUP_TIMINGS = {}
+ready_event = threading.Event()
+startup_error = None
+
+def ensure_model_loaded():
+    """모델을 한 번만 로드 (실패하면 None 유지)"""
+    global model, _model_load_attempted
+    with _model_lock:
+        if not _model_load_attempted:
+            _model_load_attempted = True
+            started = time.time()
+            model = load_model()
+            log_startup_phase("model_load", started, backend=MODEL_BACKEND, loaded=model is not None)
+    return model
+
+def use_model(external_model):
+    """이미 만들어진 모델을 사용 (벤치마크 등에서 weights.pt 없이 실행할 때)"""
+    global model, _model_load_attempted
+    with _model_lock:
+        model = external_model
+        _model_load_attempted = True
+
+def log_startup_phase(phase, started, **fields):
+    """시작 단계별 소요 시간을 기록하고 JSON 한 줄로 출력 (로그 수집기에서 파싱용)"""
+    seconds = round(time.time() - started, 4)
+    STARTUP_TIMINGS[phase] = seconds
+    print(json.dumps({"event": "startup", "phase": phase, "seconds": seconds, "pid": os.getpid(), **fields}, ensure_ascii=False))
+
+# ===== 계측 (metrics) =====
+# 워커는 요청마다 단계별 시간(perf_counter)과 메모리 샘플을 결과에 담아 돌려주고,
+# 이벤트 루프 프로세스가 이를 Prometheus 히스토그램에 기록한다 (프로세스 워커에서도 집계 가능).
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MEGAPIXEL_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 12, 16, 24, 48)
+MEMORY_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(12))  # 1MB ~ 2GB
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, label_values)} {value}")
+        return lines
+
+class Gauge:
+    """렌더링 시점에 callback으로 값을 읽는 게이지"""
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {self.callback()}"]
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = labelnames
+        # label 값 -> [버킷별 개수(+Inf 포함), 합계]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, label_values, [('le', le)])} {cumulative}")
+                labels = _format_labels(self.labelnames, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def current_rss_bytes():
+    """현재 RSS (Linux /proc 기준, 그 외 플랫폼은 0) - 요청당 수 마이크로초"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def peak_rss_bytes():
+    """프로세스 최대 RSS (Linux의 ru_maxrss는 KB 단위)"""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+class StageTimer:
+    """요청 하나의 단계별 시간 측정 - mark(stage)는 직전 mark 이후 경과 시간을 해당 단계에 기록
+    
+    단계 경계마다 RSS도 샘플링해 요청 시작 대비 최대 증가량을 근사한다
+    (스레드 백엔드에서 동시 요청이 있으면 서로의 할당이 섞일 수 있음).
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages = {}
+        self._last = time.perf_counter()
+        self._rss_start = current_rss_bytes()
+        self._rss_peak = self._rss_start
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+        self._rss_peak = max(self._rss_peak, current_rss_bytes())
+
+    def telemetry(self, **fields):
+        return {
+            "started_at": self.started_at,
+            "stages": self.stages,
+            "memory_peak_bytes": max(0, self._rss_peak - self._rss_start),
+            "process_peak_rss_bytes": peak_rss_bytes(),
+            **fields,
+        }
+
+STAGE_SECONDS = Histogram("segmentation_stage_seconds", "Pipeline stage latency", STAGE_BUCKETS, ("stage",))
+REQUEST_SECONDS = Histogram("segmentation_request_seconds", "End-to-end request latency", STAGE_BUCKETS, ("endpoint",))
+REQUESTS_TOTAL = Counter("segmentation_requests_total", "Requests by endpoint, status and cache result", ("endpoint", "status", "cache"))
+INPUT_MEGAPIXELS = Histogram("segmentation_input_megapixels", "Uploaded image resolution", MEGAPIXEL_BUCKETS)
+REQUEST_MEMORY_BYTES = Histogram("segmentation_request_memory_bytes", "Peak RSS growth observed at stage boundaries per request", MEMORY_BUCKETS)
+worker_peak_rss = 0
+
+METRICS = [
+    STAGE_SECONDS,
+    REQUEST_SECONDS,
+    REQUESTS_TOTAL,
+    INPUT_MEGAPIXELS,
+    REQUEST_MEMORY_BYTES,
+    Gauge("segmentation_inflight_requests", "Requests admitted (running + queued)", lambda: admission.in_flight),
+    Gauge("segmentation_queue_depth", "Requests waiting for a worker", lambda: max(0, admission.in_flight - WORKER_COUNT)),
+    Gauge("segmentation_queue_capacity", "Admission capacity (workers + queue)", lambda: admission.capacity),
+    Gauge("segmentation_worker_peak_rss_bytes", "Largest peak RSS reported by a worker", lambda: max(worker_peak_rss, peak_rss_bytes())),
+]
+
+def record_telemetry(telemetry, submitted_at):
+    """워커가 돌려준 단계별 측정값을 히스토그램에 기록하고 Server-Timing 항목(ms) 반환"""
+    global worker_peak_rss
+    
+    stages = dict(telemetry["stages"])
+    stages["queue"] = max(0.0, telemetry["started_at"] - submitted_at)
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.observe(seconds, stage)
+    
+    INPUT_MEGAPIXELS.observe(telemetry["input_pixels"] / 1e6)
+    REQUEST_MEMORY_BYTES.observe(telemetry["memory_peak_bytes"])
+    worker_peak_rss = max(worker_peak_rss, telemetry["process_peak_rss_bytes"])
+    return stages
+
+def format_server_timing(stages):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items())
 
 # ===== 전처리 함수 =====
 
-def smart_preprocess_image(image, target_size=MODEL_INPUT_SIZE):
-    """스마트폰 사진을 위한 지능형 전처리"""
-    start_time = time.time()
+def decode_image(image_bytes, min_side=MODEL_INPUT_SIZE):
+    """업로드 이미지 디코딩 - JPEG는 크롭 영역의 짧은 변이 min_side 이상인 선에서 축소 디코딩(draft)"""
+    image = Image.open(io.BytesIO(image_bytes))
     original_size = image.size
-    width, height = original_size
     
-    print(f"   원본 크기: {width}x{height}")
+    if image.format == "JPEG" and min_side:
+        scale = min_side / min(original_size)
+        if scale < 1:
+            # DCT 단계에서 1/2, 1/4, 1/8로 줄여서 디코딩 (요청 크기 이상 보장)
+            image.draft("RGB", (math.ceil(original_size[0] * scale), math.ceil(original_size[1] * scale)))
+    
+    return image.convert("RGB"), original_size
+
+def smart_preprocess_image(image, target_size=MODEL_INPUT_SIZE, timings=None):
+    """스마트폰 사진을 위한 지능형 전처리
+    
+    크롭 영역에 대해 한 번만 리사이즈하고, 대비/선명도/채도 보정을 하나의 벡터 연산으로
+    합쳐 미리 할당한 float 텐서에 바로 기록한다. timings(dict)를 넘기면 단계별 시간을 채운다.
+    """
+    start_time = time.perf_counter()
+    width, height = image.size
+    
+    # 1단계: 스마트 크롭 + 모델 입력 크기로 리사이즈 (크롭 후 한 번만 리샘플링)
+    crop_box = smart_crop_box(width, height)
+    resized = image.resize(
+        (target_size, target_size), Image.Resampling.LANCZOS, box=crop_box, reducing_gap=3.0
+    )
+    resized_time = time.perf_counter()
     
-    # 1단계: 너무 큰 이미지는 먼저 축소 (메모리/속도 최적화)
-    max_dimension = 2048
-    if max(width, height) > max_dimension:
-        scale = max_dimension / max(width, height)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        width, height = new_width, new_height
-        print(f"   1차 축소: {width}x{height}")
+    # 2단계: 이미지 품질 향상 + 텐서 변환 (fused)
+    img_tensor = torch.empty((1, 3, target_size, target_size), dtype=torch.float32)
+    fused_enhance_to_tensor(np.asarray(resized), img_tensor.numpy()[0])
+    enhanced_time = time.perf_counter()
+    
+    if device.type == "cuda":
+        img_tensor = img_tensor.cuda()
     
-    # 2단계: 스마트 크롭 (중앙 + 객체 중심)
+    if timings is not None:
+        timings["crop_resize"] = resized_time - start_time
+        timings["enhance"] = enhanced_time - resized_time
+        timings["to_device"] = time.perf_counter() - enhanced_time
+    
+    return img_tensor, image.size
+
+def smart_crop_box(width, height):
+    """스마트 크롭 영역 (left, top, right, bottom) - 전처리와 시각화가 같은 영역을 사용"""
     # 더 작은 차원을 기준으로 정사각형 크롭
     crop_size = min(width, height)
     
@@ -129,44 +526,46 @@ def smart_preprocess_image(image, target_size=MODEL_INPUT_SIZE):
         # 위쪽으로 약간 치우치게 (테이블 위 물건 촬영 고려)
         top = max(0, top - crop_size // 6)
     
-    cropped = image.crop((left, top, left + crop_size, top + crop_size))
-    print(f"   크롭 완료: {crop_size}x{crop_size}")
-    
-    # 3단계: 모델 입력 크기로 리사이즈
-    resized = cropped.resize((target_size, target_size), Image.Resampling.LANCZOS)
-    
-    # 4단계: 이미지 품질 향상 (선택적)
-    enhanced = enhance_image_quality(resized)
-    
-    # 5단계: 텐서 변환
-    img_array = np.array(enhanced).astype(np.float32) / 255.0
-    img_tensor = torch.from_numpy(img_array).permute(2, 0, 1).unsqueeze(0)
-    
-    if torch.cuda.is_available():
-        img_tensor = img_tensor.cuda()
-    
-    elapsed = time.time() - start_time
-    print(f"   스마트 전처리 완료: {elapsed:.3f}초")
-    
-    return img_tensor, original_size
+    return (left, top, left + crop_size, top + crop_size)
 
-def enhance_image_quality(image):
-    """스마트폰 사진 품질 향상"""
-    # 대비 및 선명도 향상 (분리수거 물품 구분에 도움)
+# 기존 ImageEnhance 3단계 (Contrast -> Sharpness -> Color)와 같은 보정 계수
+ENHANCE_CONTRAST = 1.2
+ENHANCE_SHARPNESS = 1.1
+ENHANCE_COLOR = 1.1
+SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13  # ImageFilter.SMOOTH
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)  # PIL "L" 변환 가중치
+
+def fused_enhance_to_tensor(rgb, out):
+    """대비 -> 선명도 -> 채도 보정을 float32 벡터 연산 한 번에 적용하고 (3, H, W) out에 0~1로 기록
     
-    # 대비 향상
-    contrast_enhancer = ImageEnhance.Contrast(image)
-    image = contrast_enhancer.enhance(1.2)
+    ImageEnhance는 단계마다 새 이미지를 만들고 uint8로 잘라내지만, 여기서는 중간 결과를
+    float32로 유지하므로 결과가 다르다 (같은 입력에서 평균 약 1레벨, 최대 5레벨 정도/255).
+    축소 디코딩과 한 번의 리사이즈까지 합친 전처리 전체로는 기존 경로와 최대 10레벨 정도
+    차이가 난다 (benchmarks/bench_preprocess.py).
+    """
+    x = rgb.astype(np.float32)
     
-    # 선명도 향상
-    sharpness_enhancer = ImageEnhance.Sharpness(image)
-    image = sharpness_enhancer.enhance(1.1)
+    # 대비: 평균 밝기 기준으로 확대
+    mean_luma = float(np.mean(x @ LUMA_WEIGHTS))
+    x -= mean_luma
+    x *= ENHANCE_CONTRAST
+    x += mean_luma
+    np.clip(x, 0, 255, out=x)
     
-    # 채도 약간 향상 (플라스틱, 캔 등 색상 구분에 도움)
-    color_enhancer = ImageEnhance.Color(image)
-    image = color_enhancer.enhance(1.1)
+    # 선명도: SMOOTH 필터 결과에서 멀어지는 방향으로 보간
+    smooth = cv2.filter2D(x, -1, SMOOTH_KERNEL, borderType=cv2.BORDER_REPLICATE)
+    x *= ENHANCE_SHARPNESS
+    x -= (ENHANCE_SHARPNESS - 1) * smooth
     
-    return image
+    # 채도: 흑백 이미지에서 멀어지는 방향으로 보간
+    gray = (x @ LUMA_WEIGHTS)[..., None]
+    x -= gray
+    x *= ENHANCE_COLOR
+    x += gray
+    
+    np.clip(x, 0, 255, out=x)
+    np.multiply(x.transpose(2, 0, 1), 1.0 / 255.0, out=out)
+    return out
 
 def preprocess_image(image, target_size=MODEL_INPUT_SIZE):
     """기존 함수 호환성 유지"""
@@ -174,174 +573,319 @@ def preprocess_image(image, target_size=MODEL_INPUT_SIZE):
 
 # ===== 모델 예측 =====
 
-def predict_segmentation(image_tensor):
-    """세그멘테이션 예측"""
-    start_time = time.time()
-    
-    with torch.no_grad():
-        # 모델 예측 (출력 형태는 모델에 따라 다를 수 있음)
-        outputs = model(image_tensor)
-        
-        # 출력이 딕셔너리인지 텐서인지 확인
-        if isinstance(outputs, dict):
-            if "logits" in outputs:
-                logits = outputs["logits"]
-            elif "prediction" in outputs:
-                logits = outputs["prediction"]
-            else:
-                # 첫 번째 값을 logits로 가정
-                logits = list(outputs.values())[0]
-        else:
-            # 직접 텐서인 경우
-            logits = outputs
+def extract_logits(outputs):
+    """모델 출력에서 logits 텐서 추출 (출력 형태는 모델에 따라 다를 수 있음)"""
+    # 출력이 딕셔너리인지 텐서인지 확인
+    if isinstance(outputs, dict):
+        if "logits" in outputs:
+            return outputs["logits"]
+        if "prediction" in outputs:
+            return outputs["prediction"]
+        # 첫 번째 값을 logits로 가정
+        return list(outputs.values())[0]
+    # 직접 텐서인 경우
+    return outputs
+
+def predict_segmentation_batch(image_batch, return_probs=False):
+    """배치 세그멘테이션 예측 - (N, 3, H, W) 입력을 한 번의 model() 호출로 처리
+    
+    기본(빠른 경로)은 전체 softmax 없이 디바이스에서 argmax/max logit을 계산하고,
+    신뢰도는 exp(max_logit - logsumexp(logits))로 구한다. 호스트로는 uint8 클래스 맵과
+    float16 신뢰도 맵만 복사하며 probs는 None을 돌려준다.
+    return_probs=True이면 기존처럼 전체 float32 확률맵을 함께 반환한다.
+    """
+    if CHANNELS_LAST and isinstance(model, nn.Module):
+        image_batch = image_batch.contiguous(memory_format=torch.channels_last)
+    
+    with torch.inference_mode():
+        outputs = model(image_batch)
+        logits = extract_logits(outputs)
         
-        # 소프트맥스 적용
-        probs = F.softmax(logits, dim=1)[0].cpu().numpy()
-        prediction = np.argmax(probs, axis=0)
-        confidence_map = np.max(probs, axis=0)
+        if return_probs:
+            # 소프트맥스 적용
+            probs_batch = F.softmax(logits, dim=1)
+            confidence_batch, prediction_batch = probs_batch.max(dim=1)
+            probs_batch = probs_batch.cpu().numpy()
+        else:
+            # max softmax 확률 = exp(max_logit - logsumexp)
+            max_logits, prediction_batch = logits.max(dim=1)
+            confidence_batch = torch.exp(max_logits - torch.logsumexp(logits, dim=1))
+            probs_batch = [None] * logits.shape[0]
         
-        print(f"   예측 완료 - Shape: {prediction.shape}")
-        print(f"   감지된 클래스: {np.unique(prediction)}")
+        prediction_batch = prediction_batch.to(torch.uint8).cpu().numpy()
+        confidence_batch = confidence_batch.to(torch.float16).cpu().numpy()
     
-    elapsed = time.time() - start_time
-    print(f"   모델 예측: {elapsed:.3f}초")
+    # 요청별 probs/prediction/confidence_map 슬라이스
+    return list(zip(probs_batch, prediction_batch, confidence_batch))
+
+def predict_segmentation(image_tensor, return_probs=False):
+    """세그멘테이션 예측"""
+    return predict_segmentation_batch(image_tensor, return_probs)[0]
+
+# ===== 마이크로 배칭 =====
+
+class MicroBatcher:
+    """동시에 들어온 요청의 입력 텐서를 모아 한 번의 model() 호출로 처리
     
-    return probs, prediction, confidence_map
+    첫 요청이 들어온 뒤 최대 max_wait_ms 동안 (또는 max_batch_size개가 찰 때까지)
+    다른 요청을 기다렸다가 torch.cat으로 묶어 predict_segmentation_batch()를 실행하고,
+    각 요청에는 자신의 (probs, prediction, confidence_map) 슬라이스를 돌려준다.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, image_tensor):
+        """(1, 3, H, W) 텐서를 제출하고 배치 처리 결과를 기다림 (블로킹)"""
+        self.start()
+        future = Future()
+        self._queue.put((image_tensor, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            futures = [future for _, future in batch]
+            
+            try:
+                image_batch = torch.cat([image_tensor for image_tensor, _ in batch], dim=0)
+                results = predict_segmentation_batch(image_batch)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+batcher = MicroBatcher()
 
 # ===== 후처리 =====
 
-def postprocess_prediction(prediction, confidence_map, confidence_threshold=0.3):
-    """예측 결과 후처리"""
-    start_time = time.time()
+MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+MIN_REGION_AREA = 50  # 클래스 단위 최소 면적 (opening 후 픽셀 수)
+
+def postprocess_prediction(prediction, confidence_map, confidence_threshold=0.3, min_area=MIN_REGION_AREA):
+    """예측 결과 후처리
     
+    클래스마다 전체 해상도 마스크를 만들어 opening 하는 대신 uint8 라벨 맵 하나에
+    morphology를 적용해 모든 클래스를 한 번에 opening 하고, opening 후 면적이 min_area
+    미만인 클래스를 지운다 (기존 클래스별 루프와 같은 결과). 클래스 수와 관계없이 전체
+    이미지 연산 횟수가 고정된다.
+    """
     # 신뢰도 기반 필터링
-    mask = np.where(confidence_map >= confidence_threshold, prediction, 0)
+    mask = (prediction * (confidence_map >= confidence_threshold)).astype(np.uint8, copy=False)
     
-    # Morphological operations로 노이즈 제거
-    cleaned_mask = np.zeros_like(mask)
+    # Morphological opening (모든 클래스 동시 처리)
+    # erosion: 커널 안의 이웃이 모두 같은 클래스인 픽셀(gradient == 0)만 남음
+    gradient = cv2.morphologyEx(mask, cv2.MORPH_GRADIENT, MORPH_KERNEL)
+    eroded = mask * (gradient == 0)
     
-    for class_id in range(1, len(class_names)):
-        class_mask = (mask == class_id).astype(np.uint8)
-        
-        if np.sum(class_mask) == 0:
-            continue
-        
-        # 노이즈 제거
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        opened = cv2.morphologyEx(class_mask, cv2.MORPH_OPEN, kernel)
-        
-        # 작은 영역 제거
-        if np.sum(opened) >= 50:
-            cleaned_mask[opened > 0] = class_id
+    # dilation: 서로 다른 클래스의 erosion 결과는 커널 반경 안에서 만날 수 없으므로
+    # 라벨 맵의 grayscale dilation이 클래스별 dilation 결과와 같음
+    opened = cv2.dilate(eroded, MORPH_KERNEL)
     
-    elapsed = time.time() - start_time
-    print(f"   후처리: {elapsed:.3f}초")
-    
-    return cleaned_mask
+    # 작은 클래스 제거
+    return remove_small_classes(opened, min_area)
+
+def remove_small_classes(mask, min_area=MIN_REGION_AREA):
+    """전체 면적이 min_area 미만인 클래스 제거 (히스토그램 한 번 + LUT 한 번)"""
+    class_pixels = cv2.calcHist([mask], [0], None, [256], [0, 256]).ravel()
+    lut = np.arange(256, dtype=np.uint8)
+    lut[class_pixels < min_area] = 0
+    return cv2.LUT(mask, lut)
 
 # ===== 시각화 =====
 
-def create_visualization(image, mask):
-    """시각화 생성"""
-    start_time = time.time()
+def build_palette_luts():
+    """클래스별 색상 팔레트와 overlay 블렌딩 LUT 생성"""
+    num_classes = len(class_names)
     
-    img_np = np.array(image)
+    # PREDICT 팔레트: class_id -> RGB (배경은 검정)
+    palette = np.zeros((num_classes, 3), dtype=np.uint8)
+    for class_id in range(1, num_classes):
+        palette[class_id] = class_colors_bright[class_id]
     
-    # OVERLAY 생성
-    overlay = img_np.copy().astype(np.float32)
+    # OVERLAY LUT: [class_id][channel][pixel value] -> 원본 * 0.6 + 색상 * 0.4 (배경은 원본 그대로)
+    values = np.arange(256, dtype=np.float32)
+    blend_lut = np.empty((num_classes, 3, 256), dtype=np.uint8)
+    blend_lut[0] = values
+    for class_id in range(1, num_classes):
+        color = np.array(class_colors_bright[class_id], dtype=np.float32)
+        blend_lut[class_id] = np.clip(values[None, :] * 0.6 + color[:, None] * 0.4, 0, 255)
     
-    for class_id in range(1, len(class_names)):
-        class_region = (mask == class_id)
-        if np.any(class_region):
-            color = class_colors_bright[class_id]
-            overlay[class_region] = (
-                img_np[class_region].astype(np.float32) * 0.6 +
-                np.array(color) * 0.4
-            )
+    # mask -> (class_id * 3 + channel) * 256 오프셋 (uint16 인덱스로 충분)
+    blend_offsets = (np.arange(num_classes)[:, None] * 3 + np.arange(3)[None, :]) * 256
     
-    overlay = np.clip(overlay, 0, 255).astype(np.uint8)
+    return palette, blend_lut.ravel(), blend_offsets.astype(np.uint16)
+
+PALETTE, BLEND_LUT, BLEND_OFFSETS = build_palette_luts()
+
+def create_visualization(image, mask, max_display_size=MAX_DISPLAY_SIZE, stats=None):
+    """시각화 생성
     
-    # PREDICT 생성
-    predict = np.zeros_like(img_np)
+    원본 사진 전체가 아니라 모델 입력과 같은 크롭 영역을 최대 max_display_size로 한 번
+    리사이즈하고, mask는 nearest로 한 번 업샘플한 뒤 팔레트 LUT 조회로 PREDICT/OVERLAY를
+    만든다. 업로드 사진이 커도 렌더링 시간과 메모리는 표시 해상도에만 비례한다.
+    """
+    if stats is None:
+        stats = compute_class_stats(mask)
     
-    for class_id in range(1, len(class_names)):
-        class_region = (mask == class_id)
-        if np.any(class_region):
-            predict[class_region] = class_colors_bright[class_id]
+    # 표시 해상도로 크롭 + 리사이즈 (한 번)
+    crop_box = smart_crop_box(*image.size)
+    display_size = min(crop_box[2] - crop_box[0], max_display_size)
+    view = image.resize(
+        (display_size, display_size), Image.Resampling.BILINEAR, box=crop_box, reducing_gap=2.0
+    )
+    img_np = np.asarray(view)
+    
+    # 라벨 배치는 모델 해상도 통계로 한 번만 계산
+    label_layout = layout_labels(stats, scale=display_size / mask.shape[1])
+    
+    # mask 업샘플 (nearest, 한 번)
+    mask = mask.astype(np.uint8, copy=False)
+    if mask.shape != (display_size, display_size):
+        mask = cv2.resize(mask, (display_size, display_size), interpolation=cv2.INTER_NEAREST)
     
-    # 라벨 추가
-    overlay_pil = add_labels(Image.fromarray(overlay), mask)
-    predict_pil = add_labels(Image.fromarray(predict), mask)
+    # OVERLAY 생성 (블렌딩 LUT 한 번 조회)
+    lut_index = BLEND_OFFSETS.take(mask, axis=0)
+    lut_index += img_np
+    overlay = BLEND_LUT.take(lut_index)
     
-    elapsed = time.time() - start_time
-    print(f"   시각화: {elapsed:.3f}초")
+    # PREDICT 생성 (팔레트 한 번 조회)
+    predict = PALETTE.take(mask, axis=0)
+    
+    # 라벨 추가 (같은 배치를 두 이미지에 그림)
+    overlay_pil = draw_labels(Image.fromarray(overlay), label_layout)
+    predict_pil = draw_labels(Image.fromarray(predict), label_layout)
     
     return predict_pil, overlay_pil
 
-def add_labels(image, mask):
-    """라벨 추가"""
-    draw = ImageDraw.Draw(image)
-    
+LABEL_MIN_PIXELS = 100  # 너무 작은 영역은 라벨 생략 (모델 해상도 기준)
+
+@functools.lru_cache(maxsize=None)
+def load_font(size=18):
+    """라벨 폰트 (프로세스당 한 번만 로드)"""
     try:
-        font = ImageFont.truetype(font_path, 18)
-    except:
-        font = ImageFont.load_default()
+        return ImageFont.truetype(font_path, size)
+    except Exception:
+        return ImageFont.load_default()
 
-    for class_id in range(1, len(class_names)):
-        class_mask = (mask == class_id)
-        if not np.any(class_mask):
-            continue
+@functools.lru_cache(maxsize=4)
+def coordinate_grid(shape):
+    """mask 크기별 x/y 좌표 (bincount 가중치용, 크기별로 캐시)"""
+    ys, xs = np.indices(shape, dtype=np.float32)
+    return xs.ravel(), ys.ravel()
+
+def compute_class_stats(mask):
+    """클래스별 픽셀 수와 무게중심을 한 번에 계산 (bincount 기반 0차/1차 모멘트)"""
+    num_classes = len(class_names)
+    labels = mask.ravel()
+    xs, ys = coordinate_grid(mask.shape)
+    
+    counts = np.bincount(labels, minlength=num_classes)[:num_classes]
+    sum_x = np.bincount(labels, weights=xs, minlength=num_classes)[:num_classes]
+    sum_y = np.bincount(labels, weights=ys, minlength=num_classes)[:num_classes]
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centroids = np.stack([sum_x / counts, sum_y / counts], axis=1)
+    
+    return {"counts": counts, "centroids": centroids, "total_pixels": mask.size}
 
-        if np.sum(class_mask) < 100:  # 너무 작은 영역은 생략
+def layout_labels(stats, scale=1.0, font=None):
+    """라벨 위치 계산 (PREDICT/OVERLAY 공통으로 한 번만)"""
+    font = font or load_font()
+    layout = []
+    
+    for class_id in range(1, len(class_names)):
+        if stats["counts"][class_id] < LABEL_MIN_PIXELS:
             continue
         
-        y_coords, x_coords = np.where(class_mask)
-        x_center = int(np.mean(x_coords))
-        y_center = int(np.mean(y_coords))
+        centroid_x, centroid_y = stats["centroids"][class_id]
+        x_center = int(centroid_x * scale)
+        y_center = int(centroid_y * scale)
         
         label = class_names[class_id]
         
         # 텍스트 크기 계산
-        bbox = draw.textbbox((0, 0), label, font=font)
+        bbox = font.getbbox(label)
         text_w = bbox[2] - bbox[0]
         text_h = bbox[3] - bbox[1]
         
         # 배경 박스
         padding = 4
-        box_x1 = x_center - text_w//2 - padding
-        box_y1 = y_center - text_h//2 - padding
-        box_x2 = x_center + text_w//2 + padding
-        box_y2 = y_center + text_h//2 + padding
-        
-        draw.rectangle([box_x1, box_y1, box_x2, box_y2], fill=(0, 0, 0))
-        draw.text(
-            (x_center - text_w//2, y_center - text_h//2), 
-            label, 
-            fill="white", 
-            font=font
-        )
+        box = [
+            x_center - text_w//2 - padding,
+            y_center - text_h//2 - padding,
+            x_center + text_w//2 + padding,
+            y_center + text_h//2 + padding,
+        ]
+        text_position = (x_center - text_w//2, y_center - text_h//2)
         
+        layout.append((box, text_position, label))
+    
+    return layout
+
+def draw_labels(image, layout, font=None):
+    """layout_labels() 결과를 이미지에 그림"""
+    font = font or load_font()
+    draw = ImageDraw.Draw(image)
+    
+    for box, text_position, label in layout:
+        draw.rectangle(box, fill=(0, 0, 0))
+        draw.text(text_position, label, fill="white", font=font)
+    
     return image
 
+def add_labels(image, mask):
+    """라벨 추가"""
+    return draw_labels(image, layout_labels(compute_class_stats(mask)))
+
 # ===== 결과 분석 =====
 
-def analyze_results(mask):
+def analyze_results(mask, stats=None):
     """결과 분석"""
-    detected_classes = []
-    total_pixels = mask.size
+    if stats is None:
+        stats = compute_class_stats(mask)
     
-    unique, counts = np.unique(mask, return_counts=True)
+    detected_classes = []
+    total_pixels = stats["total_pixels"]
     
-    for class_id, pixel_count in zip(unique, counts):
-        if class_id > 0 and class_id < len(class_names):
-            percentage = (pixel_count / total_pixels) * 100
-            
-            if percentage >= 0.5:  # 0.5% 이상만
-                detected_classes.append({
-                    'class': class_names[class_id],
-                    'pixels': int(pixel_count),
-                    'percentage': round(percentage, 1)
-                })
+    for class_id in range(1, len(class_names)):
+        pixel_count = int(stats["counts"][class_id])
+        percentage = (pixel_count / total_pixels) * 100
+        
+        if percentage >= 0.5:  # 0.5% 이상만
+            detected_classes.append({
+                'class': class_names[class_id],
+                'pixels': pixel_count,
+                'percentage': round(percentage, 1)
+            })
     
     detected_classes.sort(key=lambda x: x['pixels'], reverse=True)
     class_names_only = [item['class'] for item in detected_classes]
@@ -350,105 +894,810 @@ def analyze_results(mask):
 
 # ===== 메인 처리 함수 =====
 
-def process_segmentation(image_bytes):
-    """메인 세그멘테이션 처리"""
-    if model is None:
-        raise HTTPException(status_code=500, detail="모델이 로드되지 않았습니다")
+class PipelineError(Exception):
+    """파이프라인 처리 오류 (프로세스 워커에서도 pickle 가능하도록 HTTPException 대신 사용)"""
 
-    total_start_time = time.time()
+    def __init__(self, status_code, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class DeadlineExceeded(PipelineError):
+    """요청 마감 시간이 지나 처리를 중단한 경우"""
+
+    # 인자 순서는 PipelineError와 같아야 함 (unpickle 시 self.args로 다시 생성)
+    def __init__(self, status_code=504, detail="처리 마감 시간 초과"):
+        super().__init__(status_code, detail)
+
+def check_deadline(deadline):
+    """마감 시간(time.time() 기준)이 지났으면 남은 단계를 건너뛰고 중단"""
+    if deadline is not None and time.time() > deadline:
+        raise DeadlineExceeded()
+
+def process_segmentation(image_bytes, deadline=None, render=True, timer=None):
+    """메인 세그멘테이션 처리 (render=False이면 PREDICT/OVERLAY 렌더링 생략)
+    
+    timer(StageTimer)를 넘기면 단계별 시간을 기록한다 (decode/preprocess/inference/postprocess/analyze/render).
+    """
+    if ensure_model_loaded() is None:
+        raise PipelineError(500, "모델이 로드되지 않았습니다")
+    
+    # 큐에서 기다리는 동안 클라이언트 마감 시간이 지났으면 바로 중단
+    check_deadline(deadline)
+
+    timer = timer or StageTimer()
+    total_start_time = time.perf_counter()
     
     try:
-        print("🚀 세그멘테이션 처리 시작...")
-        
-        # 1. 이미지 로드
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        print(f"   원본: {image.size}")
+        # 1. 이미지 로드 (JPEG는 모델 입력 해상도까지만 디코딩)
+        # 모델 입력은 요청한 결과 종류와 관계없이 항상 같은 축소 배율로 디코딩 (같은 사진 -> 같은 마스크)
+        image, original_size = decode_image(image_bytes, MODEL_INPUT_SIZE)
+        timer.mark("decode")
         
         # 2. 전처리
-        image_tensor, original_size = preprocess_image(image)
+        image_tensor, _ = preprocess_image(image)
+        timer.mark("preprocess")
         
-        # 3. 예측
-        probs, prediction, confidence_map = predict_segmentation(image_tensor)
+        # 3. 예측 (동시 요청은 마이크로 배치로 묶어서 처리 - 배치 대기 시간 포함)
+        if ENABLE_MICRO_BATCHING:
+            probs, prediction, confidence_map = batcher.submit(image_tensor)
+        else:
+            probs, prediction, confidence_map = predict_segmentation(image_tensor)
+        timer.mark("inference")
         
         # 4. 후처리
-        final_mask = postprocess_prediction(prediction, confidence_map)
+        final_mask = postprocess_prediction(prediction, confidence_map, CONFIDENCE_THRESHOLD)
+        timer.mark("postprocess")
         
-        # 5. 결과 분석
-        class_names_only, detailed_results = analyze_results(final_mask)
+        # 5. 결과 분석 (클래스별 픽셀 수/무게중심은 한 번만 계산해 시각화와 공유)
+        class_stats = compute_class_stats(final_mask)
+        class_names_only, detailed_results = analyze_results(final_mask, class_stats)
+        timer.mark("analyze")
         
-        # 6. 시각화
-        predict_img, overlay_img = create_visualization(image, final_mask)
+        # 6. 시각화 (요청한 경우에만)
+        predict_img, overlay_img = None, None
+        if render:
+            # 표시용 이미지는 결과 해상도에 맞춰 따로 디코딩 (축소 디코딩하지 않았으면 그대로 사용)
+            display_image = image
+            if image.size != original_size and MAX_DISPLAY_SIZE > MODEL_INPUT_SIZE:
+                display_image, _ = decode_image(image_bytes, MAX_DISPLAY_SIZE)
+                timer.mark("decode")
+            predict_img, overlay_img = create_visualization(display_image, final_mask, stats=class_stats)
+            timer.mark("render")
         
-        total_elapsed = time.time() - total_start_time
-        print(f"✅ 총 처리 시간: {total_elapsed:.3f}초")
-        print(f"✅ 감지 결과: {class_names_only}")
+        total_elapsed = time.perf_counter() - total_start_time
         
-        return predict_img, overlay_img, class_names_only, total_elapsed
+        return {
+            "predict_image": predict_img,
+            "overlay_image": overlay_img,
+            "mask": final_mask,
+            "detected_classes": class_names_only,
+            "class_details": detailed_results,
+            "original_size": original_size,
+            "crop_box": smart_crop_box(*original_size),
+            "processing_time": total_elapsed,
+        }
 
+    except PipelineError:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"처리 중 오류: {str(e)}")
+        raise PipelineError(500, f"처리 중 오류: {str(e)}")
+
+# ===== 출력 형식 =====
+# - json: 기존 응답 (이미지는 base64 문자열)
+# - multipart: JSON 메타데이터 + 바이너리 이미지 파트 (base64 없음)
+# - mask: 팔레트 인덱스 마스크 PNG 하나만 (감지 클래스는 헤더로)
+
+OUTPUT_FORMATS = ("json", "multipart", "mask")
+OUTPUT_ARTIFACTS = ("prediction", "overlay", "mask")
+IMAGE_FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+MASK_FORMATS = ("png", "rle")
+
+DEFAULT_OUTPUT_OPTIONS = {
+    "format": "json",
+    "include": ("prediction", "overlay"),
+    "image_format": "png",
+    "quality": 85,
+    "mask_format": "png",
+}
+
+def parse_output_options(output_format=None, include=None, image_format="png", quality=85,
+                         mask_format="png", accept=None):
+    """쿼리 파라미터/Accept 헤더로 출력 옵션 결정 (잘못된 값은 HTTP 400)"""
+    if output_format is None:
+        # Accept 헤더로 협상 (기본은 기존 JSON)
+        accept = accept or ""
+        if "multipart/" in accept:
+            output_format = "multipart"
+        elif "image/png" in accept and "application/json" not in accept:
+            output_format = "mask"
+        else:
+            output_format = "json"
+    
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"지원하지 않는 format: {output_format}")
+    if image_format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"지원하지 않는 image_format: {image_format}")
+    if mask_format not in MASK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"지원하지 않는 mask_format: {mask_format}")
+    if not 1 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality는 1~100 사이여야 합니다")
+    
+    if output_format == "mask":
+        artifacts = ("mask",)
+        mask_format = "png"
+    elif include is None:
+        artifacts = DEFAULT_OUTPUT_OPTIONS["include"]
+    else:
+        # include=mask,classes 처럼 필요한 결과만 요청 (classes는 항상 포함)
+        requested = [name.strip() for name in include.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in OUTPUT_ARTIFACTS + ("classes",)]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"지원하지 않는 include 항목: {', '.join(unknown)}")
+        artifacts = tuple(name for name in OUTPUT_ARTIFACTS if name in requested)
+    
+    return {
+        "format": output_format,
+        "include": artifacts,
+        "image_format": image_format,
+        "quality": quality,
+        "mask_format": mask_format,
+    }
+
+def encode_image(image, image_format="png", quality=85):
+    """PIL 이미지를 PNG/JPEG/WebP 바이트로 인코딩"""
+    pil_format, media_type = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    
+    if pil_format == "PNG":
+        image.save(buffer, format="PNG", compress_level=6)
+    else:
+        image.save(buffer, format=pil_format, quality=quality)
+    
+    return buffer.getvalue(), media_type
+
+def encode_mask_png(mask):
+    """클래스 인덱스 마스크를 팔레트 PNG로 인코딩 (픽셀당 1바이트, 팔레트로 색상 확인 가능)"""
+    mask = np.ascontiguousarray(mask, dtype=np.uint8)
+    mask_img = Image.frombytes("P", (mask.shape[1], mask.shape[0]), mask.tobytes())
+    mask_img.putpalette(PALETTE.ravel().tolist())
+    
+    buffer = io.BytesIO()
+    mask_img.save(buffer, format="PNG")
+    return buffer.getvalue(), "image/png"
+
+def encode_mask_rle(mask):
+    """행 우선(row-major) 순서의 run-length 인코딩 - values[i]가 counts[i]번 반복"""
+    flat = mask.ravel()
+    run_starts = np.flatnonzero(np.diff(flat)) + 1
+    run_starts = np.concatenate(([0], run_starts))
+    counts = np.diff(np.concatenate((run_starts, [flat.size])))
+    
+    return {
+        "shape": [int(mask.shape[0]), int(mask.shape[1])],
+        "values": flat[run_starts].tolist(),
+        "counts": counts.tolist(),
+    }
+
+def run_pipeline(image_bytes, options=None, deadline=None):
+    """워커에서 실행되는 전체 파이프라인 (세그멘테이션 + 요청한 결과물 인코딩)"""
+    options = options or DEFAULT_OUTPUT_OPTIONS
+    include = options["include"]
+    render = "prediction" in include or "overlay" in include
+    
+    timer = StageTimer()
+    result = process_segmentation(image_bytes, deadline, render=render, timer=timer)
+    check_deadline(deadline)
+    
+    metadata = {
+        "detected_classes": result["detected_classes"],
+        "class_details": result["class_details"],
+        "processing_time": result["processing_time"],
+        "crop_box": list(result["crop_box"]),
+    }
+    
+    # 바이너리 결과물: name -> (bytes, media_type)
+    artifacts = {}
+    if "prediction" in include:
+        artifacts["prediction"] = encode_image(result["predict_image"], options["image_format"], options["quality"])
+    if "overlay" in include:
+        artifacts["overlay"] = encode_image(result["overlay_image"], options["image_format"], options["quality"])
+    if "mask" in include:
+        if options["mask_format"] == "rle":
+            metadata["mask_rle"] = encode_mask_rle(result["mask"])
+        else:
+            artifacts["mask"] = encode_mask_png(result["mask"])
+    
+    if options["format"] == "json":
+        # JSON 응답은 워커에서 base64까지 끝내서 이벤트 루프 부담을 줄임
+        for name, (data, _) in artifacts.items():
+            metadata[name] = base64.b64encode(data).decode("utf-8")
+        artifacts = {}
+    timer.mark("encode")
+    
+    width, height = result["original_size"]
+    telemetry = timer.telemetry(input_pixels=width * height)
+    return {"metadata": metadata, "artifacts": artifacts, "telemetry": telemetry}
+
+def build_response(result, options):
+    """run_pipeline() 결과를 요청한 출력 형식의 HTTP 응답으로 변환"""
+    metadata = result["metadata"]
+    artifacts = result["artifacts"]
+    detected_classes = metadata["detected_classes"]
+    processing_time = metadata["processing_time"]
+    
+    if detected_classes:
+        main_class = detected_classes[0]
+        confidence = 0.85
+        message = f"처리 완료 ({processing_time:.2f}초)"
+    else:
+        main_class = "unknown"
+        confidence = 0.1
+        message = f"객체 미감지 ({processing_time:.2f}초)"
+    
+    summary = {
+        "class": main_class,
+        "confidence": confidence,
+        "detected_classes": detected_classes,
+        "processing_time": round(processing_time, 3),
+        "status": "success",
+        "message": message
+    }
+    
+    if options["format"] == "json":
+        response = {key: value for key, value in metadata.items() if key not in ("processing_time", "detected_classes")}
+        response.update(summary)
+        return JSONResponse(content=response)
+    
+    if options["format"] == "mask":
+        mask_bytes, media_type = artifacts["mask"]
+        return Response(
+            content=mask_bytes,
+            media_type=media_type,
+            headers={
+                "X-Detected-Classes": json.dumps(detected_classes),
+                "X-Crop-Box": ",".join(str(v) for v in metadata["crop_box"]),
+            },
+        )
+    
+    # multipart/mixed: 첫 파트는 JSON 메타데이터, 이후 결과물별 바이너리 파트
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    
+    json_part = dict(metadata)
+    json_part.update(summary)
+    parts = [("metadata", "application/json", json.dumps(json_part, ensure_ascii=False).encode("utf-8"))]
+    parts += [(name, media_type, data) for name, (data, media_type) in artifacts.items()]
+    
+    for name, media_type, data in parts:
+        body.write(f"--{boundary}\r\n".encode())
+        body.write(f'Content-Disposition: form-data; name="{name}"\r\n'.encode())
+        body.write(f"Content-Type: {media_type}\r\n".encode())
+        body.write(f"Content-Length: {len(data)}\r\n\r\n".encode())
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    
+    return Response(content=body.getvalue(), media_type=f"multipart/mixed; boundary={boundary}")
+
+# ===== 실행 백엔드 (워커 풀) =====
+
+executor = None
+
+def _init_process_worker():
+    """프로세스 워커 초기화 - 첫 요청 전에 모델 로드 + 워밍업"""
+    global ENABLE_MICRO_BATCHING
+    
+    # 워커는 한 번에 한 요청만 처리하므로 배치 대기는 지연만 늘림
+    ENABLE_MICRO_BATCHING = False
+    
+    # 워커끼리 코어를 나눠 쓰도록 intra-op 스레드 수 제한
+    configure_torch_threads()
+    
+    if ensure_model_loaded() is not None:
+        warmup_pipeline()
+
+def worker_startup_report():
+    """프로세스 워커의 준비 상태 (initializer가 끝난 뒤 실행됨)"""
+    return {"pid": os.getpid(), "loaded": model is not None, "timings": STARTUP_TIMINGS}
+
+def make_warmup_image(size=MODEL_INPUT_SIZE):
+    """워밍업용 더미 JPEG (그라디언트 - 디코딩/후처리/시각화까지 실제 경로를 타도록)"""
+    gradient = np.linspace(0, 255, size, dtype=np.uint8)
+    pixels = np.stack(np.broadcast_arrays(gradient[None, :], gradient[:, None], gradient[::-1][None, :]), axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(pixels)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def warmup_pipeline(iterations=None):
+    """더미 512x512 입력으로 전체 파이프라인 실행 (할당자/커널/폰트/LUT 초기화 비용을 첫 요청 전에 지불)"""
+    iterations = WARMUP_ITERATIONS if iterations is None else iterations
+    if iterations <= 0:
+        return
+    
+    started = time.time()
+    image_bytes = make_warmup_image()
+    for _ in range(iterations):
+        process_segmentation(image_bytes)
+    log_startup_phase("warmup", started, iterations=iterations)
+
+def warm_start(started):
+    """startup 이후 백그라운드에서 모델 로드 + 워밍업, 끝나면 /ready를 열어줌"""
+    global startup_error
+    
+    try:
+        if EXECUTION_BACKEND == "process":
+            # 워커 수만큼 작업을 보내 모든 워커가 initializer(로드 + 워밍업)를 마칠 때까지 대기
+            futures = [executor.submit(worker_startup_report) for _ in range(WORKER_COUNT)]
+            reports = [future.result() for future in futures]
+            failed = [report["pid"] for report in reports if not report["loaded"]]
+            if failed:
+                raise RuntimeError(f"워커 모델 로드 실패 (pid: {failed})")
+        else:
+            if ensure_model_loaded() is None:
+                raise RuntimeError("모델 로드 실패")
+            warmup_pipeline()
+    except Exception as e:
+        startup_error = str(e)
+        print(json.dumps({"event": "startup", "phase": "failed", "error": startup_error, "pid": os.getpid()}, ensure_ascii=False))
+        return
+    
+    log_startup_phase("ready", started, backend=MODEL_BACKEND, execution_backend=EXECUTION_BACKEND, workers=WORKER_COUNT)
+    ready_event.set()
+
+def create_executor():
+    """EXECUTION_BACKEND 설정에 맞는 워커 풀 생성"""
+    if EXECUTION_BACKEND == "process":
+        return ProcessPoolExecutor(
+            max_workers=WORKER_COUNT,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process_worker,
+        )
+    if EXECUTION_BACKEND != "thread":
+        print(f"⚠️ 알 수 없는 실행 백엔드 '{EXECUTION_BACKEND}' - thread 사용")
+    return ThreadPoolExecutor(max_workers=WORKER_COUNT, thread_name_prefix="segmentation")
+
+@app.on_event("startup")
+async def start_executor():
+    global executor
+    started = time.time()
+    executor = create_executor()
+    print(f"🔧 실행 백엔드: {EXECUTION_BACKEND} (워커 {WORKER_COUNT}개)")
+    log_startup_phase("executor", started, execution_backend=EXECUTION_BACKEND, workers=WORKER_COUNT)
+    
+    # 모델 로드/워밍업은 백그라운드에서 진행 (그동안 /health는 응답, /ready와 /predict는 503)
+    threading.Thread(target=warm_start, args=(started,), name="warm-start", daemon=True).start()
+
+@app.on_event("shutdown")
+async def stop_executor():
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# ===== 과부하 제어 (Admission Control) =====
+
+class AdmissionController:
+    """처리 중 + 대기 요청 수를 제한하고 Retry-After를 추정 (이벤트 루프 스레드에서만 사용)"""
+
+    def __init__(self, capacity, per_client_limit):
+        self.capacity = capacity
+        self.per_client_limit = per_client_limit
+        self.in_flight = 0
+        self.client_in_flight = {}
+        # 요청당 평균 처리 시간 (EWMA, 초)
+        self.avg_processing_time = 1.0
+
+    def admit(self, client_id):
+        """수용 가능하면 슬롯을 확보하고, 아니면 503/429 HTTPException 발생"""
+        if self.in_flight >= self.capacity:
+            raise self._overload(503, "서버가 혼잡합니다. 잠시 후 다시 시도해주세요")
+        if self.client_in_flight.get(client_id, 0) >= self.per_client_limit:
+            raise self._overload(429, "이전 요청이 아직 처리 중입니다. 잠시 후 다시 시도해주세요")
+        
+        self.in_flight += 1
+        self.client_in_flight[client_id] = self.client_in_flight.get(client_id, 0) + 1
+
+    def release(self, client_id, elapsed=None):
+        self.in_flight -= 1
+        remaining = self.client_in_flight.get(client_id, 1) - 1
+        if remaining > 0:
+            self.client_in_flight[client_id] = remaining
+        else:
+            self.client_in_flight.pop(client_id, None)
+        
+        if elapsed is not None:
+            self.avg_processing_time = 0.8 * self.avg_processing_time + 0.2 * elapsed
+
+    def retry_after(self):
+        """현재 대기열이 빠지는 데 걸릴 예상 시간 (초, 정수)"""
+        waves = max(1, math.ceil(self.in_flight / max(1, WORKER_COUNT)))
+        return max(1, math.ceil(self.avg_processing_time * waves))
+
+    def _overload(self, status_code, detail):
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+admission = AdmissionController(WORKER_COUNT + MAX_QUEUE_SIZE, MAX_INFLIGHT_PER_CLIENT)
+
+def get_client_id(request):
+    """프록시(onrender.com) 뒤에서도 클라이언트를 구분하기 위한 ID"""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def get_request_deadline(request):
+    """PROCESSING_TIMEOUT과 클라이언트가 보낸 X-Request-Timeout(초) 중 짧은 쪽으로 마감 시간 계산"""
+    timeout = PROCESSING_TIMEOUT
+    client_timeout = request.headers.get("x-request-timeout")
+    if client_timeout:
+        try:
+            timeout = min(timeout, float(client_timeout))
+        except ValueError:
+            pass
+    return time.time() + timeout
+
+async def run_admitted(request, func, *args):
+    """과부하 제어 + 마감 시간을 적용해 워커 풀에서 func(*args, deadline) 실행"""
+    client_id = get_client_id(request)
+    admission.admit(client_id)
+    
+    deadline = get_request_deadline(request)
+    loop = asyncio.get_running_loop()
+    submitted = time.time()
+    
+    try:
+        future = executor.submit(func, *args, deadline)
+    except Exception:
+        admission.release(client_id)
+        raise
+    
+    # 슬롯은 워커가 실제로 작업을 끝냈을 때 반환 (타임아웃 후에도 실행 중인 작업은 용량을 차지함)
+    def on_done(f):
+        elapsed = None if f.cancelled() or f.exception() is not None else time.time() - submitted
+        loop.call_soon_threadsafe(admission.release, client_id, elapsed)
+    future.add_done_callback(on_done)
+    
+    try:
+        # 시간 초과 시 아직 시작하지 않은 작업은 취소되고, 실행 중인 작업은 다음 단계에서 중단됨
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=max(0.0, deadline - time.time()))
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="처리 마감 시간 초과",
+            headers={"Retry-After": str(admission.retry_after())},
+        )
+
+# ===== 결과 캐시 =====
+
+CACHE_FILE_SUFFIX = ".result"
+
+class ResultCache:
+    """업로드 바이트 + 파이프라인 파라미터 해시를 키로 하는 LRU 결과 캐시
+    
+    메모리 계층은 전체 바이트 수(max_bytes)와 TTL로 제한하고, disk_dir를 지정하면
+    재시작 후에도 남는 디스크 계층을 함께 사용한다 (디스크 히트는 메모리로 다시 올림).
+    항목은 JSON 헤더 + 결과 이미지 바이트로 저장한다 (pickle을 쓰지 않으므로 캐시 폴더에
+    쓸 수 있는 사람이 파일을 바꿔도 코드가 실행되지 않음).
+    """
+
+    def __init__(self, max_bytes, ttl, disk_dir=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, blob)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "disk_evictions": 0}
+        
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes, options):
+        """업로드 내용 + 결과에 영향을 주는 파라미터로 캐시 키 생성"""
+        params = {
+            "options": options,
+            "confidence_threshold": CONFIDENCE_THRESHOLD,
+            "min_region_area": MIN_REGION_AREA,
+            "model_input_size": MODEL_INPUT_SIZE,
+            "max_display_size": MAX_DISPLAY_SIZE,
+            "model_version": MODEL_VERSION,
+        }
+        digest = hashlib.sha256(image_bytes)
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def encode_entry(result):
+        """run_pipeline() 결과 -> [헤더 길이 4바이트][JSON 헤더][결과물 바이트...]"""
+        artifacts = result["artifacts"]
+        header = {
+            "metadata": result["metadata"],
+            "telemetry": result["telemetry"],
+            "artifacts": [[name, media_type, len(data)] for name, (data, media_type) in artifacts.items()],
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        return b"".join([len(header_bytes).to_bytes(4, "big"), header_bytes] + [data for data, _ in artifacts.values()])
+
+    @staticmethod
+    def decode_entry(blob):
+        """encode_entry()의 역변환 (형식이 맞지 않으면 ValueError)"""
+        try:
+            header_end = 4 + int.from_bytes(blob[:4], "big")
+            header = json.loads(blob[4:header_end])
+            artifacts, offset = {}, header_end
+            for name, media_type, size in header["artifacts"]:
+                artifacts[name] = (blob[offset:offset + size], media_type)
+                offset += size
+            result = {"metadata": header["metadata"], "artifacts": artifacts, "telemetry": header["telemetry"]}
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"잘못된 캐시 항목: {e}")
+        if offset != len(blob):
+            raise ValueError("잘못된 캐시 항목: 길이 불일치")
+        return result
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, blob = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return self.decode_entry(blob)
+                self._remove(key)
+                self.counters["expired"] += 1
+        
+        blob = self._disk_get(key, now)
+        result = None
+        if blob is not None:
+            try:
+                result = self.decode_entry(blob)
+            except ValueError as e:
+                # 깨진 파일은 지우고 새로 계산
+                print(f"⚠️ 디스크 캐시 항목 무시: {e}")
+                self._disk_remove(key)
+        with self._lock:
+            if result is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._store(key, blob, now)
+        return result
+
+    def put(self, key, result):
+        if self.max_bytes <= 0 and not self.disk_dir:
+            return
+        blob = self.encode_entry(result)
+        with self._lock:
+            self._store(key, blob, time.time())
+        self._disk_put(key, blob)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                entries=len(self._entries),
+                bytes=self.current_bytes,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl,
+                disk_enabled=bool(self.disk_dir),
+            )
+
+    def _store(self, key, blob, now):
+        if len(blob) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (now + self.ttl, len(blob), blob)
+        self.current_bytes += len(blob)
+        
+        # 용량 초과 시 가장 오래 안 쓴 항목부터 제거
+        while self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.counters["evictions"] += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}{CACHE_FILE_SUFFIX}")
+
+    def _disk_remove(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _disk_put(self, key, blob):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(blob)
+            os.replace(temp_path, path)
+            self._disk_prune()
+        except OSError as e:
+            print(f"⚠️ 디스크 캐시 저장 실패: {e}")
+
+    def _disk_prune(self):
+        """디스크 계층이 disk_max_bytes를 넘으면 오래된 파일부터 삭제"""
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(CACHE_FILE_SUFFIX):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self.counters["disk_evictions"] += 1
+            except OSError:
+                pass
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_BYTES)
+
+# 같은 키로 처리 중인 요청 (재시도가 파이프라인을 다시 돌리지 않고 기존 결과를 기다림)
+pending_results = {}
+
+async def get_or_compute(cache_key, compute):
+    """캐시 조회 -> 처리 중인 동일 요청 합류 -> 새로 계산 순서로 결과 반환 (결과, 캐시 상태)"""
+    result = await asyncio.to_thread(result_cache.get, cache_key)
+    if result is not None:
+        return result, "HIT"
+    
+    while cache_key in pending_results:
+        pending = pending_results[cache_key]
+        try:
+            return await asyncio.shield(pending), "COALESCED"
+        except asyncio.CancelledError:
+            # 계산하던 요청이 취소되었으면 기다리던 요청이 이어서 계산 (이 요청이 취소된 경우는 그대로 전파)
+            if not pending.cancelled():
+                raise
+    
+    pending = asyncio.get_running_loop().create_future()
+    pending_results[cache_key] = pending
+    try:
+        result = await compute()
+        pending.set_result(result)
+    except Exception as e:
+        pending.set_exception(e)
+        # 기다리는 요청이 없으면 "exception was never retrieved" 경고 방지
+        pending.exception()
+        raise
+    except BaseException:
+        # 이 요청만 취소된 것 - 기다리던 요청에는 취소를 넘기지 않고 다시 계산하게 함
+        pending.cancel()
+        raise
+    finally:
+        pending_results.pop(cache_key, None)
+    
+    await asyncio.to_thread(result_cache.put, cache_key, result)
+    return result, "MISS"
 
 # ===== FastAPI 엔드포인트 =====
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    """세그멘테이션 수행"""
+async def predict(
+    request: Request,
+    file: UploadFile = File(...),
+    output_format: str = Query(None, alias="format"),
+    include: str = Query(None),
+    image_format: str = Query("png"),
+    quality: int = Query(85),
+    mask_format: str = Query("png"),
+):
+    """세그멘테이션 수행
+    
+    format=json(기본)|multipart|mask, include=prediction,overlay,mask (필요한 결과물만),
+    image_format=png|jpeg|webp + quality, mask_format=png|rle
+    """
+    options = parse_output_options(
+        output_format, include, image_format, quality, mask_format,
+        accept=request.headers.get("accept"),
+    )
+    return await run_predict(request, file, options)
+
+async def run_predict(request, file, options):
+    request_start = time.perf_counter()
+    status, cache_status = 500, "NONE"
+    
     try:
+        if not ready_event.is_set():
+            detail = f"모델 준비 실패: {startup_error}" if startup_error else "모델 준비 중입니다"
+            raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+        
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="이미지 파일만 업로드 가능합니다")
 
-        request_start = time.time()
-        print(f"📤 요청 받음: {file.filename}")
-        
         image_bytes = await file.read()
-        print(f"   파일 크기: {len(image_bytes):,} bytes")
         
-        # 세그멘테이션 처리
-        predict_img, overlay_img, detected_classes, processing_time = process_segmentation(image_bytes)
-
-        # 이미지 인코딩
-        pred_bytes = io.BytesIO()
-        overlay_bytes = io.BytesIO()
+        # 세그멘테이션 처리 + 인코딩 (이벤트 루프를 막지 않도록 워커 풀에서 실행, 같은 사진은 캐시 사용)
+        submitted_at = time.time()
+        cache_key = result_cache.make_key(image_bytes, options)
+        result, cache_status = await get_or_compute(
+            cache_key, lambda: run_admitted(request, run_pipeline, image_bytes, options)
+        )
         
-        predict_img.save(pred_bytes, format="PNG", optimize=True)
-        overlay_img.save(overlay_bytes, format="PNG", optimize=True)
+        # 단계별 시간은 실제로 파이프라인을 실행한 요청에서만 기록
+        stages = record_telemetry(result["telemetry"], submitted_at) if cache_status == "MISS" else {}
 
         # 응답 생성
-        if detected_classes:
-            main_class = detected_classes[0]
-            confidence = 0.85
-            message = f"처리 완료 ({processing_time:.2f}초)"
-        else:
-            main_class = "unknown"
-            confidence = 0.1
-            message = f"객체 미감지 ({processing_time:.2f}초)"
-
-        response = {
-            "prediction": base64.b64encode(pred_bytes.getvalue()).decode("utf-8"),
-            "overlay": base64.b64encode(overlay_bytes.getvalue()).decode("utf-8"),
-            "class": main_class,
-            "confidence": confidence,
-            "detected_classes": detected_classes,
-            "processing_time": round(processing_time, 3),
-            "status": "success",
-            "message": message
-        }
-        
-        total_time = time.time() - request_start
-        print(f"📤 응답 완료: {total_time:.3f}초")
+        response = build_response(result, options)
+        response.headers["X-Cache"] = cache_status
+        stages["total"] = time.perf_counter() - request_start
+        response.headers["Server-Timing"] = format_server_timing(stages)
         
+        status = response.status_code
         return response
 
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    except DeadlineExceeded as e:
+        status = e.status_code
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(admission.retry_after())},
+        )
+    except PipelineError as e:
+        status = e.status_code
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         print(f"❌ 오류 발생: {str(e)}")
         raise HTTPException(status_code=500, detail=f"처리 중 오류: {str(e)}")
+    finally:
+        endpoint = request.url.path
+        REQUESTS_TOTAL.inc(endpoint, str(status), cache_status)
+        REQUEST_SECONDS.observe(time.perf_counter() - request_start, endpoint)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 텍스트 형식 지표 (단계별 지연 히스토그램, 요청 수, 대기열 깊이, 입력 해상도, 메모리)"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """결과 캐시 hit/miss/eviction 통계"""
+    return result_cache.stats()
 
 @app.post("/predict-raw")
-async def predict_raw(file: UploadFile = File(...)):
+async def predict_raw(request: Request, file: UploadFile = File(...)):
     """호환성 엔드포인트"""
-    return await predict(file)
+    return await run_predict(request, file, DEFAULT_OUTPUT_OPTIONS)
 
 # ===== 서버 실행 =====
 
@@ -0,0 +1,257 @@
+"""weights.pt -> int8 양자화 모델 생성 + float 모델 대비 정확도/지연/메모리 리포트
+
+사용법:
+    python quantize_model.py --mode dynamic                          # nn.Linear 동적 양자화
+    python quantize_model.py --mode static --calibration-dir samples/ # FX 정적 양자화 (샘플 사진으로 보정)
+    python quantize_model.py --report-only --images "samples/*.jpg" --json report.json
+
+생성된 모델은 MODEL_BACKEND=int8 로 서빙한다 (QUANTIZED_PATH, 기본 weights.int8.pt).
+리포트는 백엔드마다 새 프로세스에서 측정하므로 RSS는 해당 모델만 올린 서버 프로세스 기준이다.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+import main
+from export_model import export_torchscript
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# ===== 입력 준비 =====
+
+def find_images(patterns):
+    """디렉토리 또는 glob 패턴 목록 -> 이미지 경로 목록"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(
+                os.path.join(pattern, name) for name in sorted(os.listdir(pattern))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            paths.extend(sorted(glob.glob(pattern)))
+    return paths
+
+def load_inputs(paths, count):
+    """서버와 같은 디코딩/전처리를 거친 (1, 3, H, W) CPU 텐서 목록 - 사진이 없으면 고정 시드 랜덤"""
+    inputs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in paths[:count]:
+            with open(path, "rb") as f:
+                image, _ = main.decode_image(f.read())
+            tensor, _ = main.smart_preprocess_image(image)
+            inputs.append(tensor.cpu())
+
+    if not inputs:
+        print("⚠️ 샘플 사진이 없어 랜덤 입력을 사용합니다 (정적 양자화 보정/정확도 비교에는 실제 사진 권장)")
+        generator = torch.Generator().manual_seed(0)
+        size = main.MODEL_INPUT_SIZE
+        inputs = [torch.rand((1, 3, size, size), generator=generator) for _ in range(count)]
+    return inputs
+
+# ===== 양자화 =====
+
+def quantize_dynamic_int8(model):
+    """가중치만 int8로 미리 양자화하고 활성값은 실행 시 양자화 (보정 데이터 불필요)"""
+    count = sum(1 for module in model.modules() if isinstance(module, nn.Linear))
+    quantized = quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    print(f"✅ 동적 양자화 완료 - 양자화된 레이어 {count}개")
+    if count == 0:
+        print("⚠️ nn.Linear 레이어가 없어 속도 변화가 없을 수 있습니다 (--mode static 권장)")
+    return quantized
+
+def quantize_static_int8(model, calibration_inputs, engine):
+    """FX 그래프 모드 정적 양자화 - 보정 사진으로 활성값 범위를 관측한 뒤 int8 변환"""
+    qconfig_mapping = get_default_qconfig_mapping(engine)
+    try:
+        prepared = prepare_fx(model, qconfig_mapping, example_inputs=(calibration_inputs[0],))
+    except Exception as e:
+        raise RuntimeError(f"FX 트레이싱 실패 - 모델이 symbolic trace를 지원하지 않습니다 (--mode dynamic 사용): {e}")
+
+    with torch.inference_mode():
+        for tensor in calibration_inputs:
+            prepared(tensor)
+
+    quantized = convert_fx(prepared)
+    print(f"✅ 정적 양자화 완료 - 보정 샘플 {len(calibration_inputs)}개")
+    return quantized
+
+# ===== 리포트 =====
+
+def measure_current_backend(inputs, repeat, warmup):
+    """현재 프로세스(main이 MODEL_BACKEND로 로드한 모델)의 마스크/지연/RSS 측정"""
+    if main.ensure_model_loaded() is None:
+        raise RuntimeError(f"{main.MODEL_BACKEND} 모델 로드 실패")
+
+    masks, latencies = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            main.predict_segmentation(inputs[0].to(main.device))
+
+        for tensor in inputs:
+            tensor = tensor.to(main.device)
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _, prediction, _ = main.predict_segmentation(tensor)
+                latencies.append(time.perf_counter() - start)
+            masks.append(prediction)
+
+    # resource 모듈이 없는 플랫폼(Windows)에서는 0
+    peak_rss_mb = main.peak_rss_bytes() / (1024 * 1024)
+    return np.stack(masks), np.array(latencies) * 1000, peak_rss_mb
+
+def measure_in_subprocess(backend, inputs_path, repeat, warmup):
+    """백엔드별로 새 프로세스에서 측정 (모델 하나만 올린 상태의 RSS를 얻기 위해)"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, f"{backend}.npz")
+        env = dict(os.environ, MODEL_BACKEND=backend)
+        command = [
+            sys.executable, os.path.abspath(__file__), "--measure", output_path,
+            "--inputs", inputs_path, "--repeat", str(repeat), "--warmup", str(warmup),
+        ]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{backend} 측정 실패:\n{completed.stdout[-2000:]}{completed.stderr[-2000:]}")
+
+        with np.load(output_path) as data:
+            return data["masks"], data["latencies"], float(data["peak_rss_mb"])
+
+def compare_masks(reference, candidate, num_classes):
+    """float 마스크를 기준으로 한 mIoU / 클래스별 픽셀 일치율 (혼동 행렬 기반)"""
+    confusion = np.bincount(
+        reference.astype(np.int64).ravel() * num_classes + candidate.astype(np.int64).ravel(),
+        minlength=num_classes * num_classes,
+    ).reshape(num_classes, num_classes)
+
+    intersection = np.diag(confusion)
+    reference_pixels = confusion.sum(axis=1)
+    union = reference_pixels + confusion.sum(axis=0) - intersection
+
+    present = union > 0
+    iou = np.divide(intersection, union, out=np.zeros(num_classes), where=present)
+    agreement = np.divide(intersection, reference_pixels, out=np.full(num_classes, np.nan), where=reference_pixels > 0)
+
+    return {
+        "miou": float(iou[present].mean()) if present.any() else 1.0,
+        "pixel_agreement": float(intersection.sum() / max(confusion.sum(), 1)),
+        "per_class": {
+            main.class_names[class_id]: {
+                "iou": float(iou[class_id]) if present[class_id] else None,
+                "agreement": None if np.isnan(agreement[class_id]) else float(agreement[class_id]),
+                "reference_pixels": int(reference_pixels[class_id]),
+            }
+            for class_id in range(num_classes)
+        },
+    }
+
+def build_report(inputs, repeat, warmup, baseline="eager", candidate="int8"):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs_path = os.path.join(tmp_dir, "inputs.npy")
+        np.save(inputs_path, torch.cat(inputs).numpy())
+
+        results = {}
+        for backend in (baseline, candidate):
+            print(f"⏱️ {backend} 측정 중...")
+            results[backend] = measure_in_subprocess(backend, inputs_path, repeat, warmup)
+
+    report = {"samples": len(inputs), "repeat": repeat, "backends": {}}
+    for backend, (_, latencies, peak_rss_mb) in results.items():
+        report["backends"][backend] = {
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "peak_rss_mb": peak_rss_mb,
+        }
+    report["accuracy"] = compare_masks(results[baseline][0], results[candidate][0], len(main.class_names))
+    return report
+
+def print_report(report, baseline="eager", candidate="int8"):
+    backends = report["backends"]
+    print(f"\n📊 {candidate} vs {baseline} (샘플 {report['samples']}개 x {report['repeat']}회)")
+    print(f"   {'backend':<10} {'p50':>10} {'p95':>10} {'peak RSS':>11}")
+    for backend, stats in backends.items():
+        print(f"   {backend:<10} {stats['p50_ms']:>8.1f}ms {stats['p95_ms']:>8.1f}ms {stats['peak_rss_mb']:>8.0f} MB")
+    speedup = backends[baseline]["p50_ms"] / backends[candidate]["p50_ms"]
+    print(f"   p50 speedup: {speedup:.2f}x")
+
+    accuracy = report["accuracy"]
+    print(f"\n   mIoU (float 기준): {accuracy['miou']:.4f}")
+    print(f"   전체 픽셀 일치율: {accuracy['pixel_agreement']:.2%}")
+    print(f"   {'class':<12} {'IoU':>8} {'agreement':>10} {'pixels':>12}")
+    for class_name, stats in accuracy["per_class"].items():
+        iou = "-" if stats["iou"] is None else f"{stats['iou']:.4f}"
+        agreement = "-" if stats["agreement"] is None else f"{stats['agreement']:.2%}"
+        print(f"   {class_name:<12} {iou:>8} {agreement:>10} {stats['reference_pixels']:>12,}")
+
+# ===== CLI =====
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="dynamic")
+    parser.add_argument("--calibration-dir", nargs="*", default=[], help="정적 양자화 보정용 사진 (디렉토리 또는 glob)")
+    parser.add_argument("--calibration-samples", type=int, default=32)
+    parser.add_argument("--output", default=main.QUANTIZED_PATH)
+    parser.add_argument("--report-only", action="store_true", help="양자화 없이 기존 int8 모델로 리포트만")
+    parser.add_argument("--images", nargs="*", default=None, help="리포트용 사진 (기본: 보정 사진)")
+    parser.add_argument("--samples", type=int, default=16, help="리포트에 사용할 최대 사진 수")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--json", help="리포트를 JSON 파일로 저장")
+    # 내부용: 리포트 하위 프로세스 측정
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--inputs", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        inputs = [torch.from_numpy(array)[None] for array in np.load(args.inputs)]
+        masks, latencies, peak_rss_mb = measure_current_backend(inputs, args.repeat, args.warmup)
+        np.savez(args.measure, masks=masks, latencies=latencies, peak_rss_mb=peak_rss_mb)
+        return
+
+    calibration_paths = find_images(args.calibration_dir)
+
+    if not args.report_only:
+        model = main.load_model("eager")
+        if model is None:
+            sys.exit(1)
+        model = model.cpu().eval()
+        engine = main.select_quantized_engine()
+
+        if args.mode == "dynamic":
+            quantized = quantize_dynamic_int8(model)
+        else:
+            if not calibration_paths:
+                print("⚠️ --calibration-dir 사진이 없어 랜덤 입력으로 보정합니다 (정확도 저하 가능)")
+            calibration_inputs = load_inputs(calibration_paths, args.calibration_samples)
+            quantized = quantize_static_int8(model, calibration_inputs, engine)
+
+        size = main.MODEL_INPUT_SIZE
+        export_torchscript(quantized, args.output, torch.rand((1, 3, size, size)))
+        print(f"   엔진: {engine}, 파일 크기: {os.path.getsize(main.WEIGHTS_PATH) / 1e6:.1f}MB -> {os.path.getsize(args.output) / 1e6:.1f}MB")
+
+    report_paths = find_images(args.images) if args.images is not None else calibration_paths
+    inputs = load_inputs(report_paths, args.samples)
+    # 하위 프로세스가 --output 경로의 모델을 읽도록 전달
+    os.environ["QUANTIZED_PATH"] = args.output
+    report = build_report(inputs, args.repeat, args.warmup)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 리포트 저장: {args.json}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,26 +1,185 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, send_file
 import os
+import sys
+import io
+import hashlib
+import mimetypes
+import zipfile
 import supervision as sv
 from ultralytics import YOLOv10
 import cv2
+import json
+import threading
+import time
+import uuid
+from collections import deque, OrderedDict
+import numpy as np
+
+# 이미지 / 동영상 앱이 함께 쓰는 모델 레지스트리 (YOLO/model_pool.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model_pool import ModelRegistry  # noqa: E402
 
 app = Flask(__name__)
 
-# YOLO 모델 로드
-model = YOLOv10('C:/Users/Owner/Desktop/DL_Web_Image/yolov10n.pt')
+# YOLO 모델 로드 - 가중치/장치/인스턴스 수/클래스 이름은 MODEL_CONFIG 파일 또는 환경 변수로 설정
+# (../model_pool.py, models.example.json 참고)
+DEFAULT_MODEL_PATH = 'C:/Users/Owner/Desktop/DL_Web_Image/yolov10n.pt'
+model_registry = ModelRegistry.from_environment(YOLOv10, DEFAULT_MODEL_PATH)
+# 요청마다 인스턴스를 빌려 쓰므로 동시 요청 N개가 인스턴스 N개에서 안전하게 실행됨
+model_pool = model_registry.pool()
 
-# 클래스 이름 정의
-class_names = ['Mask', 'can', 'cellphone', 'electronics', 'gbottle', 'glove', 'metal', 'misc', 'net', 'pbag', 'pbottle', 'plastic', 'rod', 'sunglasses', 'tire']
+# 주석 도구는 한 번만 생성해서 재사용
+bounding_box_annotator = sv.BoundingBoxAnnotator()
+label_annotator = sv.LabelAnnotator()
 
 # 업로드 폴더 설정
 UPLOAD_FOLDER = 'static/uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# 기본은 디스크를 거치지 않는 메모리 경로 (SAVE_UPLOADS=1이면 이전처럼 static/uploads에 저장)
+SAVE_UPLOADS = os.environ.get('SAVE_UPLOADS', '0') == '1'
+# 주석 이미지 저장소 최대 크기 (바이트) - 넘으면 가장 오래 쓰이지 않은 결과부터 삭제
+RESULT_STORE_MAX_BYTES = int(os.environ.get('RESULT_STORE_MAX_BYTES', str(64 * 1024 * 1024)))
+RESULT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+# /detect-batch zip 저장소 최대 크기 (바이트) - 주석 이미지 캐시와 따로 관리해 zip이 검출 결과를 밀어내지 않게 함
+ZIP_STORE_MAX_BYTES = int(os.environ.get('ZIP_STORE_MAX_BYTES', str(256 * 1024 * 1024)))
+# /detect-batch에서 한 번의 model() 호출로 추론할 이미지 수 (요청의 batch_size로 변경 가능)
+DETECT_BATCH_SIZE = max(1, int(os.environ.get('DETECT_BATCH_SIZE', '8')))
+MAX_DETECT_BATCH_SIZE = 64
+
+# 실시간 스트림 설정
+# 이 시간 동안 프레임이 오지 않으면 세션을 닫음
+STREAM_IDLE_SECONDS = float(os.environ.get('STREAM_IDLE_SECONDS', '30'))
+# 동시에 열 수 있는 세션 수 (세션마다 워커 스레드 하나) - 넘으면 503
+MAX_STREAM_SESSIONS = max(1, int(os.environ.get('MAX_STREAM_SESSIONS', '16')))
+# FPS / 지연 통계에 쓰는 최근 프레임 수
+STREAM_STATS_WINDOW = 300
+# 결과가 없을 때 SSE 연결 유지용 주석을 보내는 간격
+STREAM_KEEPALIVE_SECONDS = 15
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
+class ResultStore:
+    """원본 이미지 내용 해시 -> 주석 이미지/검출 결과 (LRU, 전체 크기 상한)
+
+    같은 이미지가 다시 올라오면 추론 없이 저장된 결과를 돌려준다.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """저장되었으면(이미 있던 경우 포함) True, 혼자서 상한을 넘어 저장하지 못하면 False"""
+        size = len(entry['image']) + len(entry['detections'])
+        with self.lock:
+            if key in self.entries:
+                return True
+            if size > self.max_bytes:
+                return False
+            while self.entries and self.total_bytes + size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted['size']
+                self.evictions += 1
+            entry['size'] = size
+            self.entries[key] = entry
+            self.total_bytes += size
+            return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+result_store = ResultStore(RESULT_STORE_MAX_BYTES)
+zip_store = ResultStore(ZIP_STORE_MAX_BYTES)
+
+def structured_detections(detections):
+    """sv.Detections -> 열 단위 배열 (xyxy, class_id, class_name, confidence)"""
+    class_names = detections.data.get('class_name')
+    return {
+        'xyxy': [[round(float(v), 1) for v in box] for box in detections.xyxy],
+        'class_id': [int(class_id) for class_id in detections.class_id],
+        'class_name': [str(name) for name in class_names] if class_names is not None else [model_pool.names[int(c)] for c in detections.class_id],
+        'confidence': [round(float(confidence), 4) for confidence in detections.confidence],
+    }
+
+def result_extension(filename):
+    """업로드와 같은 형식으로 인코딩 (알 수 없는 확장자는 JPEG)"""
+    extension = os.path.splitext(filename)[1].lower()
+    return extension if extension in RESULT_EXTENSIONS else '.jpg'
+
+def build_result_entry(key, extension, image, result):
+    """모델 결과 하나 -> 주석 이미지 인코딩 + 저장소 항목 생성/저장 (인코딩 실패 시 None)"""
+    detections = sv.Detections.from_ultralytics(result)
+
+    annotated_image = bounding_box_annotator.annotate(
+        scene=image, detections=detections)
+    annotated_image = label_annotator.annotate(
+        scene=annotated_image, detections=detections)
+
+    ok, encoded = cv2.imencode(extension, annotated_image)
+    if not ok:
+        return None
+
+    entry = {
+        'key': key,
+        'extension': extension,
+        'image': encoded.tobytes(),
+        'width': image.shape[1],
+        'height': image.shape[0],
+        # JSON 형식으로 변환 (/detect 응답 형식 유지)
+        'detections': result.tojson(normalize=False),
+        'structured': structured_detections(detections),
+    }
+    result_store.put(key, entry)
+    return entry
+
+def decode_image_bytes(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def detect_image_bytes(data, filename):
+    """업로드 바이트 -> (저장소 항목, 캐시 적중 여부) - 디코딩/주석/인코딩 모두 메모리에서 처리
+
+    이미지를 읽을 수 없으면 (None, False)
+    """
+    key = hashlib.sha256(data).hexdigest()
+    entry = result_store.get(key)
+    if entry is not None:
+        return entry, True
+
+    image = decode_image_bytes(data)
+    if image is None:
+        return None, False
+
+    # YOLO 모델을 사용하여 예측
+    results = model_pool.predict(image)
+    return build_result_entry(key, result_extension(filename), image, results[0]), False
+
 @app.route('/detect', methods=['POST'])
 def detect():
     if 'file' not in request.files:
@@ -31,35 +190,448 @@ def detect():
         return jsonify({'error': '선택된 파일이 없습니다'}), 400
     
     if file:
-        file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        file.save(file_path)
+        if SAVE_UPLOADS:
+            return detect_from_disk(file)
 
-        # 이미지 로드
-        image = cv2.imread(file_path)
-        
-        # YOLO 모델을 사용하여 예측
-        results = model(image)
-        detections = sv.Detections.from_ultralytics(results[0])
+        entry, cached = detect_image_bytes(file.read(), file.filename)
+        if entry is None:
+            return jsonify({'error': '이미지를 읽을 수 없습니다'}), 400
 
-        bounding_box_annotator = sv.BoundingBoxAnnotator()
-        label_annotator = sv.LabelAnnotator()
+        result_id = entry['key'] + entry['extension']
+        # ?return=image 이면 JSON 대신 주석 이미지를 바로 반환
+        if request.args.get('return') == 'image':
+            response = send_file(io.BytesIO(entry['image']), mimetype=mimetypes.guess_type(result_id)[0])
+            response.headers['X-Result-Id'] = result_id
+            response.headers['X-Cache'] = 'hit' if cached else 'miss'
+            return response
 
-        annotated_image = bounding_box_annotator.annotate(
-            scene=image, detections=detections)
-        annotated_image = label_annotator.annotate(
-            scene=annotated_image, detections=detections)
+        return jsonify({
+            'detections': entry['detections'],
+            'image_path': '/results/' + result_id,
+            'cached': cached
+        })
 
-        # 결과 이미지 저장
-        annotated_image_path = os.path.join(UPLOAD_FOLDER, 'annotated_' + file.filename)
-        cv2.imwrite(annotated_image_path, annotated_image)
+def batch_result_line(index, filename, entry, cached):
+    return {
+        'index': index,
+        'filename': filename,
+        'cached': cached,
+        'width': entry['width'],
+        'height': entry['height'],
+        'image_path': '/results/' + entry['key'] + entry['extension'],
+        'detections': entry['structured'],
+    }
 
-        # JSON 형식으로 변환
-        detections_json = results[0].tojson(normalize=False)
+def detect_batch_stream(uploads, batch_size, make_zip):
+    """업로드 목록을 batch_size장씩 한 번의 model() 호출로 추론하고 이미지별 결과를 끝나는 대로 yield
 
-        return jsonify({
-            'detections': detections_json,
-            'image_path': annotated_image_path
+    model()은 크기가 다른 이미지도 각각 letterbox로 같은 입력 크기에 맞춰 한 배치로 추론한다.
+    저장소에 있는 이미지는 추론 없이 바로 결과를 보낸다.
+    """
+    started = time.perf_counter()
+    finished_entries = []
+    model_calls = 0
+    cache_hits = 0
+    errors = 0
+
+    for start in range(0, len(uploads), batch_size):
+        pending = []  # (index, filename, key, image)
+        for index, (filename, data) in enumerate(uploads[start:start + batch_size], start):
+            key = hashlib.sha256(data).hexdigest()
+            entry = result_store.get(key)
+            if entry is not None:
+                cache_hits += 1
+                finished_entries.append((filename, entry))
+                yield batch_result_line(index, filename, entry, True)
+                continue
+            image = decode_image_bytes(data)
+            if image is None:
+                errors += 1
+                yield {'index': index, 'filename': filename, 'error': '이미지를 읽을 수 없습니다'}
+                continue
+            pending.append((index, filename, key, image))
+
+        if not pending:
+            continue
+        results = model_pool.predict([image for _, _, _, image in pending], verbose=False)
+        model_calls += 1
+
+        for (index, filename, key, image), result in zip(pending, results):
+            entry = build_result_entry(key, result_extension(filename), image, result)
+            if entry is None:
+                errors += 1
+                yield {'index': index, 'filename': filename, 'error': '결과 이미지를 인코딩할 수 없습니다'}
+                continue
+            finished_entries.append((filename, entry))
+            yield batch_result_line(index, filename, entry, False)
+
+    summary = {
+        'images': len(uploads),
+        'succeeded': len(finished_entries),
+        'errors': errors,
+        'cache_hits': cache_hits,
+        'model_calls': model_calls,
+        'batch_size': batch_size,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    if make_zip and finished_entries:
+        zip_key = uuid.uuid4().hex
+        if zip_store.put(zip_key, {'key': zip_key, 'extension': '.zip', 'image': build_zip(finished_entries), 'detections': ''}):
+            summary['zip_path'] = '/results/' + zip_key + '.zip'
+        else:
+            summary['zip_error'] = f'zip이 저장소 상한({ZIP_STORE_MAX_BYTES} 바이트)보다 큽니다. 이미지를 나눠서 요청해주세요.'
+    yield {'summary': summary}
+
+def build_zip(entries):
+    """주석 이미지 zip (이미 압축된 형식이라 ZIP_STORED) - 같은 이름은 번호를 붙여 구분"""
+    buffer = io.BytesIO()
+    used_names = set()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for filename, entry in entries:
+            name = 'annotated_' + os.path.splitext(os.path.basename(filename))[0] + entry['extension']
+            base, count = name, 1
+            while name in used_names:
+                name = f"{os.path.splitext(base)[0]}_{count}{entry['extension']}"
+                count += 1
+            used_names.add(name)
+            archive.writestr(name, entry['image'])
+    return buffer.getvalue()
+
+@app.route('/detect-batch', methods=['POST'])
+def detect_batch():
+    """여러 이미지('files')를 한 요청으로 검출 - 이미지별 결과를 NDJSON으로 스트리밍
+
+    batch_size: 한 번에 추론할 이미지 수 (기본 DETECT_BATCH_SIZE)
+    zip=1: 마지막 summary 줄에 주석 이미지 zip 경로(zip_path) 포함 - zip이 ZIP_STORE_MAX_BYTES보다 크면 zip_error
+    """
+    files = [file for file in request.files.getlist('files') + request.files.getlist('file') if file.filename != '']
+    if not files:
+        return jsonify({'error': '파일이 없습니다'}), 400
+
+    try:
+        batch_size = int(request.values.get('batch_size', DETECT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({'error': 'batch_size는 정수여야 합니다'}), 400
+    batch_size = min(max(1, batch_size), MAX_DETECT_BATCH_SIZE)
+    make_zip = request.values.get('zip', '0') in ('1', 'true')
+
+    # 요청이 끝난 뒤에도 생성기가 읽을 수 있도록 미리 메모리로 읽어 둠
+    uploads = [(file.filename, file.read()) for file in files]
+
+    def generate():
+        for line in detect_batch_stream(uploads, batch_size, make_zip):
+            yield json.dumps(line, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/pool/stats')
+def pool_stats():
+    """모델 풀 대기 시간 / 사용률 - MODEL_INSTANCES 조정용"""
+    return jsonify(model_registry.stats())
+
+@app.route('/results/stats')
+def result_store_stats():
+    return jsonify({**result_store.stats(), 'zips': zip_store.stats()})
+
+@app.route('/results/<result_id>')
+def get_result(result_id):
+    """저장소의 주석 이미지 (내용 해시 주소라 내용이 바뀌지 않음 - 오래 캐시 가능)"""
+    key, extension = os.path.splitext(result_id)
+    entry = (zip_store if extension == '.zip' else result_store).get(key)
+    if entry is None or entry['extension'] != extension:
+        return jsonify({'error': '결과가 만료되었습니다. 이미지를 다시 업로드해주세요.'}), 404
+    response = send_file(
+        io.BytesIO(entry['image']),
+        mimetype=mimetypes.guess_type(result_id)[0],
+        as_attachment=extension == '.zip',
+        download_name=result_id)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def detect_from_disk(file):
+    """SAVE_UPLOADS=1 - 업로드와 주석 이미지를 static/uploads에 저장하는 이전 방식"""
+    file_path = os.path.join(UPLOAD_FOLDER, file.filename)
+    file.save(file_path)
+
+    # 이미지 로드
+    image = cv2.imread(file_path)
+    
+    # YOLO 모델을 사용하여 예측
+    results = model_pool.predict(image)
+    detections = sv.Detections.from_ultralytics(results[0])
+
+    annotated_image = bounding_box_annotator.annotate(
+        scene=image, detections=detections)
+    annotated_image = label_annotator.annotate(
+        scene=annotated_image, detections=detections)
+
+    # 결과 이미지 저장
+    annotated_image_path = os.path.join(UPLOAD_FOLDER, 'annotated_' + file.filename)
+    cv2.imwrite(annotated_image_path, annotated_image)
+
+    # JSON 형식으로 변환
+    detections_json = results[0].tojson(normalize=False)
+
+    return jsonify({
+        'detections': detections_json,
+        'image_path': annotated_image_path
+    })
+
+# 실시간 스트림 (JPEG 프레임 POST -> SSE로 프레임별 검출 결과)
+# 클라이언트마다 프레임 슬롯이 하나뿐이라 추론이 밀리면 오래된 프레임은 버려지고
+# 항상 가장 최근 프레임만 처리된다 (지연이 쌓이지 않음).
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+class StreamSession:
+    """스트림 클라이언트 하나의 상태 - 최신 프레임 슬롯, 최신 결과, 통계"""
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.condition = threading.Condition()
+        self.pending = None  # (frame_id, client_time_ms, jpeg bytes, received_at)
+        self.latest_result = None
+        self.result_seq = 0
+        self.closed = False
+        self.created_at = time.time()
+        self.last_frame_at = time.time()
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.decode_errors = 0
+        # (완료 시각, 서버 지연 ms, 대기 ms, 추론 ms, 클라이언트 시각 기준 지연 ms 또는 None)
+        self.history = deque(maxlen=STREAM_STATS_WINDOW)
+        self.received_times = deque(maxlen=STREAM_STATS_WINDOW)
+
+    def submit(self, frame_id, client_time_ms, data):
+        """프레임을 슬롯에 넣음 - 처리되지 않은 이전 프레임이 있으면 버림"""
+        now = time.time()
+        with self.condition:
+            if self.closed:
+                return False
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (frame_id, client_time_ms, data, now)
+            self.received += 1
+            self.received_times.append(now)
+            self.last_frame_at = now
+            self.condition.notify_all()
+        return True
+
+    def take(self):
+        """워커: 다음 프레임을 기다려 꺼냄 (세션이 닫히거나 유휴 시간이 지나면 None)"""
+        with self.condition:
+            while self.pending is None and not self.closed:
+                if time.time() - self.last_frame_at > STREAM_IDLE_SECONDS:
+                    self.closed = True
+                    self.condition.notify_all()
+                    break
+                self.condition.wait(timeout=1.0)
+            if self.closed:
+                return None
+            pending, self.pending = self.pending, None
+            return pending
+
+    def publish(self, message, timings):
+        with self.condition:
+            self.latest_result = message
+            self.result_seq += 1
+            self.processed += 1
+            self.history.append(timings)
+            self.condition.notify_all()
+
+    def record_decode_error(self):
+        with self.condition:
+            self.decode_errors += 1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            history = list(self.history)
+            received_times = list(self.received_times)
+            result = {
+                'client_id': self.client_id,
+                'closed': self.closed,
+                'received': self.received,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'decode_errors': self.decode_errors,
+            }
+
+        def fps(times):
+            return (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else None
+
+        server_ms = [h[1] for h in history]
+        end_to_end_ms = [h[4] for h in history if h[4] is not None]
+        result.update({
+            'input_fps': fps(received_times),
+            'output_fps': fps([h[0] for h in history]),
+            'server_latency_ms': {'p50': percentile(server_ms, 50), 'p95': percentile(server_ms, 95)},
+            'queue_ms': {'p50': percentile([h[2] for h in history], 50)},
+            'inference_ms': {'p50': percentile([h[3] for h in history], 50)},
+            # X-Client-Time(에포크 ms) 기준 - 같은 호스트이거나 시계가 맞춰져 있을 때만 의미 있음
+            'end_to_end_ms': {'p50': percentile(end_to_end_ms, 50), 'p95': percentile(end_to_end_ms, 95)},
         })
+        return result
+
+stream_sessions = {}
+stream_sessions_lock = threading.Lock()
+
+def detect_stream_frame(data):
+    """JPEG 바이트 -> 압축된 검출 목록 [[x1, y1, x2, y2, class_id, confidence], ...]"""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    results = model_pool.predict(image, verbose=False)
+    detections = sv.Detections.from_ultralytics(results[0])
+    return [
+        [round(float(x1), 1), round(float(y1), 1), round(float(x2), 1), round(float(y2), 1), int(class_id), round(float(confidence), 3)]
+        for (x1, y1, x2, y2), class_id, confidence in zip(detections.xyxy, detections.class_id, detections.confidence)
+    ]
+
+def stream_worker(session):
+    """세션 전용 스레드: 슬롯의 최신 프레임을 꺼내 추론하고 결과를 게시"""
+    while True:
+        pending = session.take()
+        if pending is None:
+            break
+        frame_id, client_time_ms, data, received_at = pending
+        started_at = time.time()
+        try:
+            boxes = detect_stream_frame(data)
+        except Exception as e:
+            print(f"Stream error ({session.client_id}): {str(e)}")
+            boxes = None
+        if boxes is None:
+            session.record_decode_error()
+            continue
+
+        finished_at = time.time()
+        message = {
+            'frame_id': frame_id,
+            'client_time': client_time_ms,
+            'server_ms': round((finished_at - received_at) * 1000, 1),
+            'boxes': boxes,
+        }
+        end_to_end_ms = finished_at * 1000 - client_time_ms if client_time_ms is not None else None
+        session.publish(message, (
+            finished_at,
+            (finished_at - received_at) * 1000,
+            (started_at - received_at) * 1000,
+            (finished_at - started_at) * 1000,
+            end_to_end_ms,
+        ))
+
+    with stream_sessions_lock:
+        stream_sessions.pop(session.client_id, None)
+    print(f"스트림 종료: {session.client_id} ({session.processed}/{session.received} 프레임 처리, {session.dropped} 프레임 버림)")
+
+def get_stream_session(client_id):
+    with stream_sessions_lock:
+        return stream_sessions.get(client_id)
+
+@app.route('/stream', methods=['POST'])
+def create_stream():
+    """스트림 세션 생성 - 프레임 업로드 / 결과 구독 / 통계 URL 반환"""
+    client_id = uuid.uuid4().hex
+    session = StreamSession(client_id)
+    with stream_sessions_lock:
+        if len(stream_sessions) >= MAX_STREAM_SESSIONS:
+            return jsonify({'error': f'스트림 세션이 가득 찼습니다 (최대 {MAX_STREAM_SESSIONS}개)'}), 503, {
+                'Retry-After': str(int(STREAM_IDLE_SECONDS))}
+        stream_sessions[client_id] = session
+    threading.Thread(target=stream_worker, args=(session,), daemon=True).start()
+
+    return jsonify({
+        'client_id': client_id,
+        'frame_url': f'/stream/{client_id}/frame',
+        'events_url': f'/stream/{client_id}/events',
+        'stats_url': f'/stream/{client_id}/stats',
+        'names': {int(class_id): name for class_id, name in model_pool.names.items()},
+    }), 201
+
+@app.route('/stream/<client_id>/frame', methods=['POST'])
+def stream_frame(client_id):
+    """JPEG 프레임 한 장 (본문 그대로 또는 multipart 'file') - 바로 202 반환, 결과는 events로 전달
+
+    선택 헤더: X-Frame-Id (결과에 그대로 실림), X-Client-Time (에포크 ms, 지연 계산용)
+    """
+    session = get_stream_session(client_id)
+    if session is None:
+        return jsonify({'error': '스트림을 찾을 수 없습니다'}), 404
+
+    data = request.files['file'].read() if 'file' in request.files else request.get_data()
+    if not data:
+        return jsonify({'error': '프레임이 없습니다'}), 400
+
+    try:
+        client_time_ms = float(request.headers['X-Client-Time']) if 'X-Client-Time' in request.headers else None
+    except ValueError:
+        return jsonify({'error': 'X-Client-Time은 숫자여야 합니다'}), 400
+    frame_id = request.headers.get('X-Frame-Id', str(session.received + 1))
+
+    if not session.submit(frame_id, client_time_ms, data):
+        return jsonify({'error': '스트림이 종료되었습니다'}), 410
+    return jsonify({'frame_id': frame_id, 'dropped': session.dropped}), 202
+
+@app.route('/stream/<client_id>/events')
+def stream_events(client_id):
+    """Server-Sent Events - 처리가 끝난 프레임마다 한 줄 JSON (느린 구독자는 최신 결과만 받음)"""
+    session = get_stream_session(client_id)
+    if session is None:
+        return jsonify({'error': '스트림을 찾을 수 없습니다'}), 404
+
+    def generate():
+        seen = session.result_seq
+        while True:
+            with session.condition:
+                session.condition.wait_for(
+                    lambda: session.result_seq != seen or session.closed, timeout=STREAM_KEEPALIVE_SECONDS)
+                if session.closed:
+                    break
+                if session.result_seq == seen:
+                    message = None
+                else:
+                    seen = session.result_seq
+                    message = session.latest_result
+            if message is None:
+                yield ': keepalive\n\n'
+            else:
+                yield 'data: ' + json.dumps(message, separators=(',', ':')) + '\n\n'
+        yield 'event: close\ndata: {}\n\n'
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/stream/<client_id>/stats')
+def stream_stats(client_id):
+    session = get_stream_session(client_id)
+    if session is None:
+        return jsonify({'error': '스트림을 찾을 수 없습니다'}), 404
+    return jsonify(session.stats())
+
+@app.route('/stream/stats')
+def all_stream_stats():
+    with stream_sessions_lock:
+        sessions = list(stream_sessions.values())
+    return jsonify({'streams': [session.stats() for session in sessions]})
+
+@app.route('/stream/<client_id>', methods=['DELETE'])
+def close_stream(client_id):
+    session = get_stream_session(client_id)
+    if session is None:
+        return jsonify({'error': '스트림을 찾을 수 없습니다'}), 404
+    stats = session.stats()
+    session.close()
+    return jsonify(stats)
 
 if __name__ == '__main__':
     app.run(debug=True)
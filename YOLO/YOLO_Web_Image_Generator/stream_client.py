@@ -0,0 +1,178 @@
+"""동영상 파일을 카메라처럼 재생해 /stream 엔드포인트에 보내고 지연/FPS를 측정하는 테스트 클라이언트
+
+프레임을 원본 FPS(또는 --fps)에 맞춰 JPEG로 POST하고, SSE로 돌아오는 결과를 받아
+보낸 시각 대비 종단 간 지연, 결과 FPS, 버려진 프레임 수를 계산한다.
+
+사용법:
+    python app_image.py                                   # 서버 (다른 터미널)
+    python stream_client.py --video sample.mp4
+    python stream_client.py --video sample.mp4 --fps 60 --width 960 --duration 20 --json stream.json
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+def connect(server):
+    parts = urlsplit(server)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port, timeout=30)
+
+def request_json(connection, method, path, body=None, headers=None):
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read() or b"{}")
+
+def read_events(server, events_url, sent_times, received, stop_event):
+    """SSE 수신 스레드: 결과가 올 때마다 (프레임 ID, 받은 시각, 박스 수) 기록"""
+    connection = connect(server)
+    connection.request("GET", events_url, headers={"Accept": "text/event-stream"})
+    response = connection.getresponse()
+    while not stop_event.is_set():
+        line = response.readline()
+        if not line:
+            break
+        line = line.decode().strip()
+        if line.startswith("event: close"):
+            break
+        if not line.startswith("data: "):
+            continue
+        message = json.loads(line[len("data: "):])
+        now = time.perf_counter()
+        sent_at = sent_times.get(message["frame_id"])
+        if sent_at is not None:
+            received.append((message["frame_id"], now, (now - sent_at) * 1000, len(message["boxes"]), message["server_ms"]))
+    connection.close()
+
+def iterate_frames(video_path, loop):
+    while True:
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        count = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            count += 1
+            yield frame, fps
+        cap.release()
+        if not loop or count == 0:
+            return
+
+def run(args):
+    control = connect(args.server)
+    status, session = request_json(control, "POST", "/stream")
+    if status != 201:
+        raise SystemExit(f"스트림 생성 실패 ({status}): {session}")
+    print(f"📡 스트림 {session['client_id']}")
+
+    sent_times = {}
+    received = []
+    stop_event = threading.Event()
+    reader = threading.Thread(
+        target=read_events, args=(args.server, session["events_url"], sent_times, received, stop_event), daemon=True)
+    reader.start()
+
+    uploader = connect(args.server)
+    sent = 0
+    started = time.perf_counter()
+    next_send = started
+    for frame, video_fps in iterate_frames(args.video, args.loop):
+        elapsed = time.perf_counter() - started
+        if args.duration and elapsed > args.duration:
+            break
+
+        # 카메라처럼 일정한 간격으로 보냄 (--fps 0이면 가능한 한 빨리)
+        fps = args.fps if args.fps is not None else video_fps
+        if fps > 0:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_send = max(next_send + 1.0 / fps, time.perf_counter() - 1.0 / fps)
+
+        if args.width and frame.shape[1] > args.width:
+            height = int(frame.shape[0] * args.width / frame.shape[1])
+            frame = cv2.resize(frame, (args.width, height), interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+        if not ok:
+            continue
+
+        sent += 1
+        frame_id = str(sent)
+        sent_times[frame_id] = time.perf_counter()
+        status, _ = request_json(uploader, "POST", session["frame_url"], body=jpeg.tobytes(), headers={
+            "Content-Type": "image/jpeg",
+            "X-Frame-Id": frame_id,
+            "X-Client-Time": f"{time.time() * 1000:.1f}",
+        })
+        if status != 202:
+            print(f"⚠️ 프레임 {frame_id} 업로드 실패 ({status})")
+    send_seconds = time.perf_counter() - started
+
+    # 마지막 프레임 결과를 잠시 기다린 뒤 세션 종료
+    time.sleep(args.drain)
+    _, server_stats = request_json(control, "DELETE", f"/stream/{session['client_id']}")
+    stop_event.set()
+    reader.join(timeout=5)
+
+    latencies = np.array([r[2] for r in received]) if received else np.array([])
+    result_times = [r[1] for r in received]
+    return {
+        "video": args.video,
+        "sent": sent,
+        "send_fps": sent / send_seconds if send_seconds > 0 else None,
+        "results": len(received),
+        "dropped": sent - len(received),
+        "result_fps": (len(result_times) - 1) / (result_times[-1] - result_times[0]) if len(result_times) > 1 else None,
+        "end_to_end_ms": {
+            "p50": float(np.percentile(latencies, 50)) if latencies.size else None,
+            "p95": float(np.percentile(latencies, 95)) if latencies.size else None,
+            "p99": float(np.percentile(latencies, 99)) if latencies.size else None,
+            "max": float(latencies.max()) if latencies.size else None,
+        },
+        "server": server_stats,
+    }
+
+def print_report(report):
+    def ms(value):
+        return "-" if value is None else f"{value:.1f}ms"
+
+    def rate(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    latency = report["end_to_end_ms"]
+    print(f"\n📤 보낸 프레임: {report['sent']} ({rate(report['send_fps'])} fps)")
+    print(f"📥 받은 결과: {report['results']} ({rate(report['result_fps'])} fps), 버려진 프레임 {report['dropped']}")
+    print(f"⏱️ 종단 간 지연: p50 {ms(latency['p50'])}, p95 {ms(latency['p95'])}, p99 {ms(latency['p99'])}, 최대 {ms(latency['max'])}")
+    server = report["server"]
+    print(f"🖥️ 서버: 처리 {server.get('processed')} / 수신 {server.get('received')}, "
+          f"서버 지연 p50 {ms(server.get('server_latency_ms', {}).get('p50'))}, "
+          f"추론 p50 {ms(server.get('inference_ms', {}).get('p50'))}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", default="http://127.0.0.1:5000")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--fps", type=float, help="보내는 FPS (기본: 동영상 FPS, 0이면 최대 속도)")
+    parser.add_argument("--width", type=int, default=640, help="보내기 전 축소할 최대 가로 크기 (0이면 원본)")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG 품질")
+    parser.add_argument("--duration", type=float, help="최대 재생 시간 (초)")
+    parser.add_argument("--loop", action="store_true", help="동영상을 반복 재생 (--duration과 함께 사용)")
+    parser.add_argument("--drain", type=float, default=1.0, help="마지막 프레임 후 결과를 기다리는 시간 (초)")
+    parser.add_argument("--json", help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 결과 저장: {args.json}")
+
+if __name__ == "__main__":
+    main_cli()
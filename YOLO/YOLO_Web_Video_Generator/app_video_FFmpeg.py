@@ -1,16 +1,37 @@
 from flask import Flask, request, jsonify, render_template, send_from_directory
 import os
+import sys
 import supervision as sv
 from ultralytics import YOLOv10
 import cv2
 import os
 from urllib.parse import quote
 import subprocess
+import threading
+import queue
+import time
+import uuid
+import re
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+
+# 이미지 / 동영상 앱이 함께 쓰는 모델 레지스트리 (YOLO/model_pool.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model_pool import ModelRegistry  # noqa: E402
 
 app = Flask(__name__)
 
-# YOLO 모델 로드
-model = YOLOv10('C:/Users/Owner/Desktop/DL_Web_Video/yolov10n.pt')
+# YOLO 모델 레지스트리 - 가중치/장치/인스턴스 수는 MODEL_CONFIG 파일 또는 환경 변수로 설정 (../model_pool.py 참고)
+# 풀은 처음 쓸 때 로드 (구간 워커 프로세스는 로드 전에 인스턴스 수를 1로 줄임)
+DEFAULT_MODEL_PATH = 'C:/Users/Owner/Desktop/DL_Web_Video/yolov10n.pt'
+model_registry = ModelRegistry.from_environment(YOLOv10, DEFAULT_MODEL_PATH)
+
+# 주석 도구는 한 번만 생성해서 모든 프레임에 재사용
+bounding_box_annotator = sv.BoundingBoxAnnotator()
+label_annotator = sv.LabelAnnotator()
 
 # 업로드 폴더 설정
 UPLOAD_FOLDER = 'static/uploads'
@@ -20,110 +41,867 @@ if not os.path.exists(UPLOAD_FOLDER):
 if not os.path.exists(OUTPUT_FOLDER):
     os.makedirs(OUTPUT_FOLDER)
 
-def reencode_video(input_path, output_path):
-    ffmpeg_path = 'C:/Users/Owner/AppData/Local/Microsoft/WinGet/Links/ffmpeg.exe'  
+# FFmpeg 설정 (FFMPEG_PATH 환경 변수로 변경 가능, 기본 경로가 없으면 PATH의 ffmpeg 사용)
+DEFAULT_FFMPEG_PATH = 'C:/Users/Owner/AppData/Local/Microsoft/WinGet/Links/ffmpeg.exe'
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH') or (DEFAULT_FFMPEG_PATH if os.path.exists(DEFAULT_FFMPEG_PATH) else 'ffmpeg')
+
+# 스트리밍 파이프라인 설정 (디코딩/추론/인코딩 사이 대기 프레임 수 - 메모리 사용량 상한)
+FRAME_QUEUE_SIZE = int(os.environ.get('FRAME_QUEUE_SIZE', '8'))
+# 한 번의 model() 호출로 추론할 프레임 수 (benchmark_video.py로 CPU에 맞는 값 확인)
+BATCH_SIZE = max(1, int(os.environ.get('BATCH_SIZE', '8')))
+DEFAULT_FPS = 30.0  # 컨테이너에 FPS 정보가 없을 때
+
+# 시간적 일관성 모드 (DETECT_EVERY > 1이면 k프레임마다 또는 장면 변화 시에만 검출하고 사이 프레임은 추적)
+DETECT_EVERY = max(1, int(os.environ.get('DETECT_EVERY', '1')))
+# 마지막 검출 프레임 대비 축소 그레이 이미지의 평균 절대 차이 (0~255) - 넘으면 즉시 검출
+SCENE_CHANGE_THRESHOLD = float(os.environ.get('SCENE_CHANGE_THRESHOLD', '12.0'))
+SCENE_THUMBNAIL_SIZE = (64, 36)
+
+# 구간 병렬 처리 (CHUNK_WORKERS > 1이면 키프레임 단위 구간을 워커 프로세스들이 각자의 모델로 처리)
+CHUNK_WORKERS = int(os.environ.get('CHUNK_WORKERS', '0'))
+# 구간이 너무 잘게 나뉘지 않도록 하는 최소 길이 (초)
+MIN_CHUNK_SECONDS = float(os.environ.get('MIN_CHUNK_SECONDS', '2.0'))
+# 구간마다 트랙 ID 대역을 나눔 (구간 i는 i * TRACK_ID_STRIDE + 1부터) - 구간 사이 ID가 겹치지 않게
+TRACK_ID_STRIDE = 10000
+
+# 작업(job) 설정 - 업로드는 바로 job ID를 반환하고 백그라운드 워커가 대기열을 처리
+# 작업들은 모델 풀을 함께 쓰므로 MODEL_INSTANCES보다 많은 작업은 추론 차례를 기다림 (디코딩/인코딩은 겹쳐서 진행)
+JOB_WORKERS = max(1, int(os.environ.get('JOB_WORKERS', '2')))
+MAX_PENDING_JOBS = max(1, int(os.environ.get('MAX_PENDING_JOBS', '16')))
+# 끝난 작업의 결과 파일/상태를 보관하는 시간 (지나면 정리 스레드가 삭제)
+OUTPUT_TTL_SECONDS = int(os.environ.get('OUTPUT_TTL_SECONDS', '3600'))
+CLEANUP_INTERVAL_SECONDS = 60
+
+_END_OF_STREAM = object()
+
+class VideoCancelled(Exception):
+    """처리 중 작업이 취소됨"""
+
+def put_until_stopped(frame_queue, item, stop_event):
+    """큐가 가득 차면 기다리되, 파이프라인이 중단되면 포기 (스레드가 영원히 막히지 않도록)"""
+    while not stop_event.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def read_frames(cap, frame_queue, stop_event, errors):
+    """디코딩 스레드: 프레임을 읽어 큐에 넣음 (큐가 가득 차면 추론이 따라올 때까지 대기)"""
     try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if not put_until_stopped(frame_queue, frame, stop_event):
+                break
+    except Exception as e:
+        errors.append(e)
+    finally:
+        put_until_stopped(frame_queue, _END_OF_STREAM, stop_event)
+
+def write_frames(process, frame_queue, stop_event, errors):
+    """인코딩 스레드: 주석이 그려진 RGB 프레임을 ffmpeg stdin으로 전달"""
+    try:
+        while True:
+            try:
+                frame = frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                # 중단 시 큐가 비워져 종료 표시가 오지 않을 수 있음
+                if stop_event.is_set():
+                    break
+                continue
+            if frame is _END_OF_STREAM:
+                break
+            process.stdin.write(frame.tobytes())
+    except Exception as e:
+        # ffmpeg가 먼저 종료된 경우 (BrokenPipeError 등) - 나머지 단계도 중단
+        errors.append(e)
+        stop_event.set()
+    finally:
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+
+def start_ffmpeg(source_path, output_path, width, height, fps):
+    """raw RGB 프레임(stdin) + 원본 파일의 오디오 트랙을 한 번에 H.264/AAC mp4로 인코딩
+
+    source_path가 None이면 영상만 인코딩 (구간 병렬 처리의 조각 파일)
+    """
+    if source_path is None:
         command = [
-            ffmpeg_path,
-            '-i', input_path,
+            FFMPEG_PATH,
+            '-y',
+            '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'rgb24',
+            '-s', f'{width}x{height}',
+            '-r', f'{fps:.6f}',
+            '-i', '-',
             '-c:v', 'libx264',
-            '-c:a', 'aac',
-            '-strict', 'experimental',
-            '-b:a', '192k',
+            '-preset', 'veryfast',
             '-pix_fmt', 'yuv420p',
-            '-movflags', 'faststart',
             output_path
         ]
-        subprocess.run(command, check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error during re-encoding: {str(e)}")
-        return False
-    except FileNotFoundError as e:
-        print(f"FFmpeg not found: {str(e)}")
-        return False
-    
+        return subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    command = [
+        FFMPEG_PATH,
+        '-y',
+        '-loglevel', 'error',
+        # 입력 0: 파이프로 들어오는 주석 프레임
+        '-f', 'rawvideo',
+        '-pix_fmt', 'rgb24',
+        '-s', f'{width}x{height}',
+        '-r', f'{fps:.6f}',
+        '-i', '-',
+        # 입력 1: 원본 동영상 (오디오만 사용)
+        '-i', source_path,
+        '-map', '0:v:0',
+        '-map', '1:a:0?',
+        '-c:v', 'libx264',
+        '-preset', 'veryfast',
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-shortest',
+        '-movflags', '+faststart',
+        output_path
+    ]
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def detect_batch(frames):
+    """프레임 여러 장을 한 번의 model() 호출로 추론 (결과는 입력 순서대로)"""
+    if not frames:
+        return []
+    results = model_registry.pool().predict(frames, verbose=False)
+    return [sv.Detections.from_ultralytics(result) for result in results]
+
+def annotate(frame, detections, labels=None):
+    """박스/라벨 그리기 (RGB 순서 유지)"""
+    annotated_image = bounding_box_annotator.annotate(
+        scene=frame, detections=detections)
+    annotated_image = label_annotator.annotate(
+        scene=annotated_image, detections=detections, labels=labels)
+    return annotated_image
+
+def annotate_batch(frames):
+    """프레임마다 검출 + 주석"""
+    return [annotate(frame, detections) for frame, detections in zip(frames, detect_batch(frames))]
+
+def track_labels(detections):
+    """트랙 ID가 포함된 라벨 (#id class confidence)"""
+    class_names = detections.data.get('class_name', detections.class_id)
+    return [
+        f"#{tracker_id} {class_name} {confidence:.2f}"
+        for tracker_id, class_name, confidence in zip(detections.tracker_id, class_names, detections.confidence)
+    ]
+
+class TemporalDetector:
+    """k프레임마다(또는 장면이 크게 바뀌면) 검출하고, 사이 프레임은 추적 결과를 이어가는 상태 객체
+
+    검출 프레임에서는 ByteTrack으로 트랙 ID를 이어 붙이고, 트랙별 프레임당 이동량을 기억했다가
+    검출하지 않는 프레임에서는 마지막 박스를 등속으로 이동시켜 그린다.
+    track_id_offset은 ByteTrack이 매긴 ID에 더해지는 값 (구간 병렬 처리에서 구간별 ID 대역).
+    """
+
+    def __init__(self, detect_every=DETECT_EVERY, scene_change_threshold=SCENE_CHANGE_THRESHOLD, fps=DEFAULT_FPS,
+                 track_id_offset=0):
+        self.detect_every = max(1, detect_every)
+        self.track_id_offset = track_id_offset
+        self.scene_change_threshold = scene_change_threshold
+        # 트래커는 검출 프레임에서만 갱신되므로 그 간격에 맞춘 frame_rate 사용
+        self.tracker = sv.ByteTrack(frame_rate=max(1, int(round(fps / self.detect_every))))
+
+        # 검출 여부 판단용 상태
+        self.reference_thumbnail = None
+        self.frames_since_detection = 0
+
+        # 박스 이어가기 상태
+        self.tracked = sv.Detections.empty()
+        self.velocity = {}  # tracker_id -> 프레임당 xyxy 이동량
+        self.steps_since_update = 0
+
+        self.frames = 0
+        self.detector_runs = 0
+        self.scene_changes = 0
+
+    def needs_detection(self, frame):
+        """프레임 순서대로 호출 - 이 프레임에서 검출기를 돌려야 하는지 판단"""
+        thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), SCENE_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        self.frames += 1
+
+        due = self.reference_thumbnail is None or self.frames_since_detection + 1 >= self.detect_every
+        if not due:
+            difference = cv2.absdiff(thumbnail, self.reference_thumbnail).mean()
+            if difference > self.scene_change_threshold:
+                due = True
+                self.scene_changes += 1
+
+        if due:
+            self.reference_thumbnail = thumbnail
+            self.frames_since_detection = 0
+            self.detector_runs += 1
+        else:
+            self.frames_since_detection += 1
+        return due
+
+    def update(self, detections):
+        """검출 프레임 - 트랙 ID를 붙이고 이전 검출 대비 이동량 갱신"""
+        tracked = self.tracker.update_with_detections(detections)
+        if self.track_id_offset and tracked.tracker_id is not None:
+            tracked.tracker_id = tracked.tracker_id + self.track_id_offset
+        gap = self.steps_since_update + 1
+
+        previous = {}
+        if self.tracked.tracker_id is not None:
+            previous = dict(zip(self.tracked.tracker_id, self.tracked.xyxy))
+        self.velocity = {
+            tracker_id: (xyxy - previous[tracker_id]) / gap
+            for tracker_id, xyxy in zip(tracked.tracker_id, tracked.xyxy)
+            if tracker_id in previous
+        }
+        self.tracked = tracked
+        self.steps_since_update = 0
+        return tracked
+
+    def propagate(self, frame_shape):
+        """검출하지 않는 프레임 - 마지막 트랙 박스를 등속으로 이동"""
+        self.steps_since_update += 1
+        if len(self.tracked) == 0:
+            return self.tracked
+
+        height, width = frame_shape[:2]
+        shift = np.array([self.velocity.get(tracker_id, np.zeros(4)) for tracker_id in self.tracked.tracker_id])
+        moved = sv.Detections(
+            xyxy=np.clip(self.tracked.xyxy + shift * self.steps_since_update, 0, [width, height, width, height]),
+            confidence=self.tracked.confidence,
+            class_id=self.tracked.class_id,
+            tracker_id=self.tracked.tracker_id,
+            data=self.tracked.data,
+        )
+        return moved
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'detector_runs': self.detector_runs,
+            'scene_changes': self.scene_changes,
+            'detect_every': self.detect_every,
+        }
+
+def track_batch(frames, temporal):
+    """시간적 일관성 모드 검출 - 검출이 필요한 프레임만 모아 한 번에 추론하고 나머지는 추적으로 채움"""
+    keyframe_flags = [temporal.needs_detection(frame) for frame in frames]
+    keyframe_detections = iter(detect_batch([frame for frame, is_key in zip(frames, keyframe_flags) if is_key]))
+
+    detections_per_frame = []
+    for frame, is_key in zip(frames, keyframe_flags):
+        if is_key:
+            detections_per_frame.append(temporal.update(next(keyframe_detections)))
+        else:
+            detections_per_frame.append(temporal.propagate(frame.shape))
+    return detections_per_frame
+
+def annotate_batch_temporal(frames, temporal):
+    """시간적 일관성 모드 검출 + 트랙 ID 라벨 주석"""
+    return [
+        annotate(frame, detections, labels=track_labels(detections))
+        for frame, detections in zip(frames, track_batch(frames, temporal))
+    ]
+
+def collect_batch(frame_queue, batch_size, stop_event):
+    """큐에서 최대 batch_size장을 모음 (첫 장은 기다리고, 나머지는 이미 디코딩된 것만)
+
+    반환: (프레임 목록, 스트림 종료 여부)
+    """
+    while True:
+        if stop_event.is_set():
+            return [], True
+        try:
+            frame = frame_queue.get(timeout=0.1)
+            break
+        except queue.Empty:
+            continue
+    if frame is _END_OF_STREAM:
+        return [], True
+    batch = [frame]
+    while len(batch) < batch_size:
+        try:
+            frame = frame_queue.get(timeout=0.05)
+        except queue.Empty:
+            break
+        if frame is _END_OF_STREAM:
+            return batch, True
+        batch.append(frame)
+    return batch, False
+
+def process_video(video_path, output_path, detect_every=DETECT_EVERY, progress=None, cancel_event=None):
+    """디코딩 -> 추론/주석 -> ffmpeg 인코딩을 스트리밍으로 처리 (프레임을 메모리에 모아두지 않음)
+
+    디코딩과 인코딩은 별도 스레드에서 돌고, 단계 사이는 FRAME_QUEUE_SIZE 크기의 큐로 연결되어
+    동영상 길이와 관계없이 메모리 사용량이 일정하다. 원본 FPS와 오디오 트랙을 유지한다.
+    detect_every > 1이면 k프레임마다(또는 장면 변화 시) 검출하고 사이 프레임은 추적으로 채운다.
+    progress(처리한 프레임 수, 전체 프레임 수)는 배치마다 호출되고, cancel_event가 설정되면
+    ffmpeg를 종료하고 VideoCancelled를 발생시킨다.
+    반환: 처리 통계 (프레임 수, 검출기 실행 횟수 등)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError('동영상 파일을 열 수 없습니다.')
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps <= 0:
+        fps = DEFAULT_FPS
+    # 컨테이너 메타데이터 기준 (진행률 표시용 추정치, 0이면 알 수 없음)
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+    # 첫 프레임으로 출력 해상도 결정
+    ret, first_frame = cap.read()
+    if not ret:
+        cap.release()
+        raise ValueError('동영상에서 프레임을 읽을 수 없습니다.')
+    height, width = first_frame.shape[:2]
+
+    process = start_ffmpeg(video_path, output_path, width, height, fps)
+    temporal = TemporalDetector(detect_every, fps=fps) if detect_every > 1 else None
+
+    stop_event = threading.Event()
+    errors = []
+    # 디코딩 큐는 배치 하나 이상을 담을 수 있어야 함
+    decoded_frames = queue.Queue(maxsize=max(FRAME_QUEUE_SIZE, BATCH_SIZE))
+    annotated_frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    decoded_frames.put(first_frame)
+
+    reader = threading.Thread(target=read_frames, args=(cap, decoded_frames, stop_event, errors), daemon=True)
+    writer = threading.Thread(target=write_frames, args=(process, annotated_frames, stop_event, errors), daemon=True)
+    reader.start()
+    writer.start()
+
+    cnt = 0
+    try:
+        finished = False
+        while not finished and not stop_event.is_set():
+            if cancel_event is not None and cancel_event.is_set():
+                stop_event.set()
+                break
+            batch, finished = collect_batch(decoded_frames, BATCH_SIZE, stop_event)
+            if not batch:
+                break
+            # 기존과 같이 RGB 순서로 추론/주석 (ffmpeg에는 rgb24로 그대로 전달)
+            batch = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in batch]
+            annotated_batch = annotate_batch_temporal(batch, temporal) if temporal else annotate_batch(batch)
+            for annotated_image in annotated_batch:
+                if not put_until_stopped(annotated_frames, annotated_image, stop_event):
+                    break
+                cnt += 1
+            if progress is not None:
+                progress(cnt, total_frames)
+    except Exception:
+        stop_event.set()
+        raise
+    finally:
+        put_until_stopped(annotated_frames, _END_OF_STREAM, stop_event)
+        if stop_event.is_set():
+            # 중단된 경우 대기 중인 스레드가 빠져나오도록 큐를 비움
+            for pending in (decoded_frames, annotated_frames):
+                while not pending.empty():
+                    pending.get_nowait()
+            process.kill()
+        reader.join()
+        writer.join()
+        cap.release()
+        stderr = process.stderr.read().decode(errors='replace')
+        process.wait()
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise VideoCancelled()
+    if errors:
+        raise RuntimeError(f'스트리밍 처리 중 오류: {errors[0]} {stderr}')
+    if process.returncode != 0:
+        raise RuntimeError(f'FFmpeg 인코딩 실패 (code {process.returncode}): {stderr}')
+
+    stats = temporal.stats() if temporal else {'frames': cnt, 'detector_runs': cnt, 'scene_changes': 0, 'detect_every': 1}
+    stats['frames'] = cnt
+    print(f"처리 완료: {cnt} 프레임, {fps:.2f} fps, {width}x{height}, 검출 {stats['detector_runs']}회")
+    return stats
+
+def find_keyframes(video_path):
+    """키프레임 시각(초, 첫 프레임 기준)과 출력 프레임 크기 - ffmpeg showinfo로 키프레임만 디코딩"""
+    command = [
+        FFMPEG_PATH,
+        '-hide_banner',
+        '-loglevel', 'info',
+        '-skip_frame', 'nokey',
+        '-i', video_path,
+        '-map', '0:v:0',
+        '-vf', 'showinfo',
+        '-f', 'null',
+        '-'
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f'키프레임 분석 실패 (code {result.returncode}): {result.stderr.decode(errors="replace")[-500:]}')
+
+    lines = [line for line in result.stderr.decode(errors='replace').splitlines() if 'showinfo' in line and 'pts_time:' in line]
+    times = [float(re.search(r'pts_time:(-?[\d.]+)', line).group(1)) for line in lines]
+    if not times:
+        raise ValueError('동영상에서 프레임을 읽을 수 없습니다.')
+    size = re.search(r' s:(\d+)x(\d+)', lines[0])
+    # -ss는 스트림 시작 시각 기준이므로 첫 키프레임을 0으로 맞춤
+    return [t - times[0] for t in times], (int(size.group(1)), int(size.group(2)))
+
+def plan_chunks(keyframes, duration, workers, min_seconds=MIN_CHUNK_SECONDS):
+    """키프레임에서 시작하는 (시작, 끝) 구간 목록 - 워커당 2개 정도로 나눠 느린 구간이 전체를 붙잡지 않게 함
+
+    마지막 구간의 끝은 None (파일 끝까지)
+    """
+    target = max(min_seconds, duration / max(1, workers * 2))
+    starts = [0.0]
+    for keyframe in keyframes[1:]:
+        if keyframe - starts[-1] >= target and duration - keyframe >= min_seconds / 2:
+            starts.append(keyframe)
+    return list(zip(starts, starts[1:] + [None]))
+
+def _init_chunk_worker(threads):
+    """구간 워커 프로세스 초기화 - 프로세스마다 자기 모델 인스턴스 하나를 로드"""
+    import torch
+    torch.set_num_threads(threads)
+    model_registry.configure(instances=1)
+    model_registry.pool()
+
+def process_chunk(video_path, chunk_path, start, end, width, height, fps, detect_every=1, chunk_index=0,
+                  stop_path=None):
+    """워커 프로세스: [start, end) 구간을 디코딩 -> 추론/주석 -> 영상만 인코딩
+
+    start는 키프레임이라 구간마다 같은 프레임부터 정확히 시작한다. 시간적 일관성 모드에서는
+    경계 앞 몇 프레임을 먼저 추적기에 흘려(pre-roll) 속도/검출 주기가 순차 처리와 이어지게 한다.
+    추적기는 구간마다 새로 만들어지므로 경계를 넘는 물체는 다음 구간에서 새 트랙 ID를 받는다
+    (ID 대역은 chunk_index로 나눠 구간 사이에 같은 ID가 다른 물체에 붙지 않게 함).
+    stop_path 파일이 생기면 배치 사이에서 멈추고 VideoCancelled를 던진다.
+    """
+    frame_time = 1.0 / fps
+    preroll = min(int(round(start * fps)), 2 * detect_every) if detect_every > 1 else 0
+    seek = max(0.0, start - preroll * frame_time)
+
+    command = [FFMPEG_PATH, '-loglevel', 'error', '-ss', f'{seek:.6f}', '-i', video_path]
+    if end is not None:
+        # 다음 구간의 첫 프레임(end)은 제외 - 반 프레임 여유로 시각 반올림 오차 흡수
+        command += ['-t', f'{end - seek - frame_time / 2:.6f}']
+    command += ['-map', '0:v:0', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+    # stderr는 임시 파일로 - 파이프면 에러 출력이 많을 때 stdout 읽기와 서로 막힐 수 있음
+    decoder_log = tempfile.TemporaryFile()
+    decoder = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=decoder_log)
+    encoder = start_ffmpeg(None, chunk_path, width, height, fps)
+    temporal = (TemporalDetector(detect_every, fps=fps, track_id_offset=chunk_index * TRACK_ID_STRIDE)
+                if detect_every > 1 else None)
+
+    frame_bytes = width * height * 3
+    frames_read = 0
+    frames_written = 0
+    finished = False
+    stopped = False
+    try:
+        while not finished:
+            if stop_path is not None and os.path.exists(stop_path):
+                stopped = True
+                break
+            batch = []
+            while len(batch) < BATCH_SIZE:
+                data = decoder.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    finished = True
+                    break
+                batch.append(np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3).copy())
+            if not batch:
+                break
+
+            annotated_batch = annotate_batch_temporal(batch, temporal) if temporal else annotate_batch(batch)
+            for annotated_image in annotated_batch:
+                frames_read += 1
+                if frames_read <= preroll:
+                    continue
+                encoder.stdin.write(annotated_image.tobytes())
+                frames_written += 1
+    finally:
+        if not finished:
+            # 끝까지 읽지 않고 나가는 경우 - 남은 구간을 디코딩하지 않게 바로 종료
+            decoder.kill()
+        decoder.stdout.close()
+        decoder.wait()
+        decoder_log.seek(0)
+        decoder_stderr = decoder_log.read().decode(errors='replace')
+        decoder_log.close()
+        encoder.stdin.close()
+        stderr = encoder.stderr.read().decode(errors='replace')
+        encoder.wait()
+
+    if stopped:
+        raise VideoCancelled()
+    if decoder.returncode != 0:
+        raise RuntimeError(f'FFmpeg 구간 디코딩 실패 (code {decoder.returncode}): {decoder_stderr}')
+    if encoder.returncode != 0:
+        raise RuntimeError(f'FFmpeg 구간 인코딩 실패 (code {encoder.returncode}): {stderr}')
+    stats = temporal.stats() if temporal else {'detector_runs': frames_read, 'scene_changes': 0}
+    return {'frames': frames_written, 'detector_runs': stats['detector_runs'], 'scene_changes': stats['scene_changes']}
+
+def concat_chunks(chunk_paths, source_path, output_path):
+    """조각 영상을 concat demuxer로 재인코딩 없이 이어 붙이고 원본 오디오를 다시 입힘"""
+    list_path = os.path.join(os.path.dirname(chunk_paths[0]), 'chunks.txt')
+    with open(list_path, 'w') as f:
+        for chunk_path in chunk_paths:
+            f.write(f"file '{os.path.abspath(chunk_path)}'\n")
+
+    command = [
+        FFMPEG_PATH,
+        '-y',
+        '-loglevel', 'error',
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', list_path,
+        '-i', source_path,
+        '-map', '0:v:0',
+        '-map', '1:a:0?',
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-shortest',
+        '-movflags', '+faststart',
+        output_path
+    ]
+    result = subprocess.run(command, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f'FFmpeg 구간 병합 실패 (code {result.returncode}): {result.stderr.decode(errors="replace")}')
+
+_chunk_pool = None
+_chunk_pool_lock = threading.Lock()
+
+def create_chunk_pool(workers):
+    """구간 워커 프로세스 풀 (spawn - 프로세스마다 YOLOv10 인스턴스 하나, 코어를 나눠 씀)"""
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_chunk_worker,
+        initargs=(threads,),
+    )
+
+def get_chunk_pool():
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            _chunk_pool = create_chunk_pool(CHUNK_WORKERS)
+        return _chunk_pool
+
+def process_video_chunked(video_path, output_path, detect_every=DETECT_EVERY, progress=None, cancel_event=None,
+                          pool=None, workers=None):
+    """키프레임 경계로 나눈 구간을 워커 프로세스에서 병렬 처리한 뒤 이어 붙임
+
+    process_video와 같은 인자/반환값. 구간이 하나뿐이면 순차 처리로 넘긴다.
+    progress는 구간이 끝날 때마다 호출된다.
+    """
+    workers = workers or CHUNK_WORKERS
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError('동영상 파일을 열 수 없습니다.')
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps <= 0:
+        fps = DEFAULT_FPS
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    cap.release()
+
+    keyframes, (width, height) = find_keyframes(video_path)
+    chunks = plan_chunks(keyframes, total_frames / fps, workers)
+    if len(chunks) == 1:
+        return process_video(video_path, output_path, detect_every, progress=progress, cancel_event=cancel_event)
+
+    pool = pool or get_chunk_pool()
+    work_dir = tempfile.mkdtemp(prefix='chunks_', dir=UPLOAD_FOLDER)
+    chunk_paths = [os.path.join(work_dir, f'chunk_{index:04d}.mp4') for index in range(len(chunks))]
+    stop_path = os.path.join(work_dir, 'stop')
+    futures = [
+        pool.submit(process_chunk, video_path, chunk_path, start, end, width, height, fps, detect_every,
+                    index, stop_path)
+        for index, (chunk_path, (start, end)) in enumerate(zip(chunk_paths, chunks))
+    ]
+    try:
+        frames_done = 0
+        pending = set(futures)
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                raise VideoCancelled()
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                frames_done += future.result()['frames']
+            if done and progress is not None:
+                progress(frames_done, total_frames)
+
+        results = [future.result() for future in futures]
+        concat_chunks(chunk_paths, video_path, output_path)
+    except BaseException:
+        # 대기 중인 구간은 취소하고, 실행 중인 구간은 stop 파일로 멈춘 뒤 끝날 때까지 기다림
+        # (작업 폴더를 지우기 전에 워커가 그 안에 쓰는 것을 모두 끝내야 함)
+        for future in futures:
+            future.cancel()
+        open(stop_path, 'w').close()
+        wait(futures)
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stats = {
+        'frames': sum(result['frames'] for result in results),
+        'detector_runs': sum(result['detector_runs'] for result in results),
+        'scene_changes': sum(result['scene_changes'] for result in results),
+        'detect_every': detect_every,
+        'chunks': len(chunks),
+        'workers': workers,
+    }
+    print(f"처리 완료: {stats['frames']} 프레임, {fps:.2f} fps, {width}x{height}, 구간 {len(chunks)}개 / 워커 {workers}개")
+    return stats
+
+# 작업 상태 저장소 (프로세스 메모리 - 서버 재시작 시 초기화, 남은 파일은 정리 스레드가 삭제)
+jobs = {}
+jobs_lock = threading.Lock()
+job_queue = queue.Queue(maxsize=MAX_PENDING_JOBS)
+_workers_started = False
+
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+class VideoJob:
+    """업로드 한 건의 처리 상태 (워커 스레드가 갱신하고 /jobs/<id>가 읽음)"""
+
+    def __init__(self, job_id, video_path, output_filename, detect_every):
+        self.job_id = job_id
+        self.video_path = video_path
+        self.output_filename = output_filename
+        self.output_path = os.path.join(OUTPUT_FOLDER, output_filename).replace("\\", "/")
+        self.detect_every = detect_every
+        self.cancel_event = threading.Event()
+
+        self.status = 'queued'
+        self.frames_done = 0
+        self.total_frames = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stats = None
+        self.error = None
+
+    def update_progress(self, frames_done, total_frames):
+        self.frames_done = frames_done
+        # 메타데이터의 프레임 수가 실제보다 작을 수 있음
+        self.total_frames = max(total_frames, frames_done)
+
+    def to_dict(self):
+        now = time.time()
+        result = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'frames_done': self.frames_done,
+            'total_frames': self.total_frames or None,
+            'progress': self.frames_done / self.total_frames if self.total_frames else None,
+            'eta_seconds': None,
+            'elapsed_seconds': ((self.finished_at or now) - self.started_at) if self.started_at else None,
+        }
+        # 지금까지의 처리 속도로 남은 시간 추정
+        if self.status == 'running' and self.frames_done and self.total_frames:
+            rate = self.frames_done / max(now - self.started_at, 1e-6)
+            result['eta_seconds'] = (self.total_frames - self.frames_done) / rate
+        if self.status == 'done':
+            result['video_path'] = '/outputs/' + quote(self.output_filename)
+            result['stats'] = self.stats
+        if self.error:
+            result['error'] = self.error
+        return result
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def run_job(job):
+    """워커 스레드에서 작업 하나 처리 (오류 메시지는 기존 /detect 응답과 동일)"""
+    job.status = 'running'
+    job.started_at = time.time()
+    try:
+        # CHUNK_WORKERS > 1이면 구간 병렬 처리
+        process = process_video_chunked if CHUNK_WORKERS > 1 else process_video
+        job.stats = process(
+            job.video_path, job.output_path, job.detect_every,
+            progress=job.update_progress, cancel_event=job.cancel_event)
+        # 인코딩된 파일이 제대로 생성되었는지 확인
+        if not os.path.exists(job.output_path):
+            job.error = '동영상 파일이 생성되지 않았습니다.'
+            job.status = 'failed'
+        else:
+            job.total_frames = job.frames_done
+            job.status = 'done'
+    except VideoCancelled:
+        remove_file(job.output_path)
+        job.status = 'cancelled'
+    except (FileNotFoundError, RuntimeError) as e:
+        print(f"Error during encoding: {str(e)}")
+        remove_file(job.output_path)
+        job.error = '동영상 파일 재인코딩 중 오류가 발생했습니다.'
+        job.status = 'failed'
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        remove_file(job.output_path)
+        job.error = '오류가 발생했습니다. 다시 시도해주세요.'
+        job.status = 'failed'
+    finally:
+        job.finished_at = time.time()
+        remove_file(job.video_path)
+        print(f"작업 {job.job_id}: {job.status} ({job.finished_at - job.started_at:.1f}s)")
+
+def job_worker():
+    """대기열에서 작업을 하나씩 꺼내 처리 (JOB_WORKERS개가 동시에 실행)"""
+    while True:
+        job = job_queue.get()
+        try:
+            if job.cancel_event.is_set():
+                # 대기 중에 취소된 작업
+                remove_file(job.video_path)
+                continue
+            run_job(job)
+        finally:
+            job_queue.task_done()
+
+def cleanup_expired(now=None):
+    """보관 시간이 지난 작업 상태와 업로드/결과 파일 삭제
+
+    처리 중인 작업의 파일은 남기고, 서버 재시작 전에 남은 파일은 수정 시각 기준으로 삭제한다.
+    """
+    now = now or time.time()
+    with jobs_lock:
+        expired = [
+            job_id for job_id, job in jobs.items()
+            if job.status in FINISHED_STATUSES and job.finished_at and now - job.finished_at > OUTPUT_TTL_SECONDS
+        ]
+        for job_id in expired:
+            del jobs[job_id]
+        active_paths = {
+            os.path.normpath(path)
+            for job in jobs.values() if job.status not in FINISHED_STATUSES
+            for path in (job.video_path, job.output_path)
+        }
+
+    removed = 0
+    for folder in (UPLOAD_FOLDER, OUTPUT_FOLDER):
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if os.path.normpath(path) in active_paths or not os.path.isfile(path):
+                continue
+            if now - os.path.getmtime(path) > OUTPUT_TTL_SECONDS:
+                remove_file(path)
+                removed += 1
+    return len(expired), removed
+
+def cleanup_loop():
+    while True:
+        time.sleep(CLEANUP_INTERVAL_SECONDS)
+        try:
+            expired_jobs, removed_files = cleanup_expired()
+            if expired_jobs or removed_files:
+                print(f"정리: 작업 {expired_jobs}개, 파일 {removed_files}개 삭제")
+        except Exception as e:
+            print(f"Cleanup error: {str(e)}")
+
+def start_job_workers():
+    """첫 업로드 시 워커/정리 스레드 시작 (한 번만)"""
+    global _workers_started
+    with jobs_lock:
+        if _workers_started:
+            return
+        for _ in range(JOB_WORKERS):
+            threading.Thread(target=job_worker, daemon=True).start()
+        threading.Thread(target=cleanup_loop, daemon=True).start()
+        _workers_started = True
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
 @app.route('/detect', methods=['POST'])
 def detect():
+    """업로드를 저장하고 작업을 대기열에 넣은 뒤 바로 job ID 반환 (진행 상황은 /jobs/<id>)"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': '파일이 없습니다'}), 400
-        
+
         file = request.files['file']
         if file.filename == '':
             return jsonify({'error': '선택된 파일이 없습니다'}), 400
-        
-        if file:
-            filename = os.path.join(UPLOAD_FOLDER, file.filename)
-            file.save(filename)
-
-            video_path = filename
-
-            frames = []
-            cap = cv2.VideoCapture(video_path)
-            while(cap.isOpened()):
-                ret, frame = cap.read()
-                if ret:
-                    frames.append(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
-                else:
-                    break
 
-            cnt = 0
-            frame_lst = []
-            for frame in frames:
-                results = model(frame)[0]
-                detections = sv.Detections.from_ultralytics(results)
-                bounding_box_annotator = sv.BoundingBoxAnnotator()
-                label_annotator = sv.LabelAnnotator()
-                annotated_image = bounding_box_annotator.annotate(
-                    scene=frame, detections=detections)
-                annotated_image = label_annotator.annotate(
-                    scene=annotated_image, detections=detections)
-                final_image = cv2.cvtColor(annotated_image, cv2.COLOR_RGB2BGR)
-                frame_lst.append(final_image)
-                cnt+=1
-                
-            width = final_image.shape[1]
-            height = final_image.shape[0]
-            fps = cnt/20
-
-            output_filename = 'output_' + file.filename.rsplit('.', 1)[0] + '.mp4'
-            output_path = os.path.join(OUTPUT_FOLDER, output_filename)
-            output_path = output_path.replace("\\", "/")
-            temp_output_path = output_path.replace('.mp4', '_temp.mp4')
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(temp_output_path, fourcc, fps, (width, height))
-
-            for frame in frame_lst:
-                out.write(frame)
-            out.release()
-
-            # 동영상 파일 재인코딩
-            if not reencode_video(temp_output_path, output_path):
-                return jsonify({'error': '동영상 파일 재인코딩 중 오류가 발생했습니다.'}), 500
-
-            # 재인코딩된 파일이 제대로 생성되었는지 확인
-            if not os.path.exists(output_path):
-                return jsonify({'error': '동영상 파일이 생성되지 않았습니다.'}), 500
-
-            # 임시 파일 삭제
-            os.remove(temp_output_path)
-
-            # 상대 경로 반환
-            relative_path = os.path.join(OUTPUT_FOLDER, output_filename).replace("\\", "/")
-            return jsonify({'video_path': '/outputs/' + quote(output_filename)}), 200
+        # k프레임마다 검출 (폼 값이 없으면 DETECT_EVERY 설정 사용)
+        try:
+            detect_every = max(1, int(request.form.get('detect_every', DETECT_EVERY)))
+        except ValueError:
+            return jsonify({'error': 'detect_every는 정수여야 합니다'}), 400
+
+        start_job_workers()
+
+        # 같은 이름의 파일이 동시에 처리될 수 있으므로 job ID를 파일 이름에 포함
+        job_id = uuid.uuid4().hex
+        video_path = os.path.join(UPLOAD_FOLDER, job_id + '_' + file.filename)
+        output_filename = 'output_' + file.filename.rsplit('.', 1)[0] + '_' + job_id + '.mp4'
+        file.save(video_path)
+
+        job = VideoJob(job_id, video_path, output_filename, detect_every)
+        with jobs_lock:
+            jobs[job_id] = job
+        try:
+            job_queue.put_nowait(job)
+        except queue.Full:
+            with jobs_lock:
+                del jobs[job_id]
+            remove_file(video_path)
+            response = jsonify({'error': '대기 중인 작업이 너무 많습니다. 잠시 후 다시 시도해주세요.'})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+
+        return jsonify({'job_id': job_id, 'status': job.status, 'status_url': '/jobs/' + job_id}), 202
 
     except Exception as e:
         print(f"Error: {str(e)}")  # 예외 메시지를 콘솔에 출력
         return jsonify({'error': '오류가 발생했습니다. 다시 시도해주세요.'}), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '작업을 찾을 수 없습니다'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """대기 중이면 바로 취소, 처리 중이면 다음 배치에서 ffmpeg를 종료하고 취소"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': '작업을 찾을 수 없습니다'}), 404
+        if job.status in FINISHED_STATUSES:
+            return jsonify({'error': '이미 끝난 작업입니다', **job.to_dict()}), 409
+        job.cancel_event.set()
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+    return jsonify(job.to_dict()), 202
+
+@app.route('/pool/stats')
+def pool_stats():
+    """모델 풀 대기 시간 / 사용률 - MODEL_INSTANCES 조정용"""
+    return jsonify(model_registry.stats())
+
 @app.route('/outputs/<path:filename>')
 def download_file(filename):
     return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=False, mimetype='video/mp4')
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    model_registry.pool()
+    app.run(debug=True)
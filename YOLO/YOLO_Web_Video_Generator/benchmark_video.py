@@ -0,0 +1,284 @@
+"""배치 크기별 프레임 추론 + 주석 처리량 (frames/s) 측정
+
+사용법:
+    python benchmark_video.py --video sample.mp4 --frames 64 --batch-sizes 1 2 4 8 16
+    python benchmark_video.py --weights yolov10n.pt          # 동영상이 없으면 합성 720p 프레임 사용
+    python benchmark_video.py --video sample.mp4 --temporal 5 # k프레임마다 검출 모드의 속도 향상 / 박스 drift 리포트
+    python benchmark_video.py --video sample.mp4 --chunk-workers 1 2 4 8  # 구간 병렬 처리의 워커 수별 속도 향상
+
+결과를 보고 서버의 BATCH_SIZE / DETECT_EVERY / CHUNK_WORKERS 환경 변수를 정한다.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import supervision as sv
+
+def load_frames(video_path, count):
+    """동영상 앞부분 count장 (서버와 같은 RGB 순서)"""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+def make_synthetic_frames(count, width=1280, height=720, seed=0):
+    """움직이는 사각형/원이 있는 합성 720p 프레임"""
+    rng = np.random.default_rng(seed)
+    background = np.zeros((height, width, 3), dtype=np.uint8)
+    background[..., 0] = np.linspace(40, 200, width, dtype=np.uint8)[None, :]
+    background[..., 1] = np.linspace(60, 160, height, dtype=np.uint8)[:, None]
+
+    shapes = [(int(rng.integers(0, width)), int(rng.integers(0, height)), int(rng.integers(40, 160))) for _ in range(6)]
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        for shape_index, (x, y, size) in enumerate(shapes):
+            x = (x + index * 7 * (shape_index + 1)) % width
+            color = tuple(int(v) for v in rng.integers(0, 256, size=3))
+            if shape_index % 2:
+                cv2.circle(frame, (x, y), size // 2, color, -1)
+            else:
+                cv2.rectangle(frame, (x, y), (x + size, y + size), color, -1)
+        frames.append(frame)
+    return frames
+
+def run_batch_size(annotate_batch, frames, batch_size, warmup):
+    for _ in range(warmup):
+        annotate_batch([frame.copy() for frame in frames[:batch_size]])
+
+    # 주석은 프레임에 직접 그려지므로 매번 복사본 사용 (복사 시간은 측정에서 제외)
+    batches = [[frame.copy() for frame in frames[start:start + batch_size]] for start in range(0, len(frames), batch_size)]
+    start = time.perf_counter()
+    for batch in batches:
+        annotate_batch(batch)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "batch_size": batch_size,
+        "frames": len(frames),
+        "seconds": elapsed,
+        "fps": len(frames) / elapsed,
+        "ms_per_frame": elapsed * 1000 / len(frames),
+    }
+
+def match_detections(reference, candidate, iou_threshold):
+    """같은 클래스끼리 IoU가 가장 큰 쌍부터 1:1 매칭 - (매칭 수, 매칭된 IoU 목록)"""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, []
+    ious = sv.box_iou_batch(reference.xyxy, candidate.xyxy)
+    ious[reference.class_id[:, None] != candidate.class_id[None, :]] = 0
+
+    matched_ious = []
+    while True:
+        row, col = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[row, col] < iou_threshold:
+            break
+        matched_ious.append(float(ious[row, col]))
+        ious[row, :] = 0
+        ious[:, col] = 0
+    return len(matched_ious), matched_ious
+
+def run_temporal_report(app, frames, detect_every, batch_size, iou_threshold):
+    """매 프레임 검출(기준) 대비 k프레임 검출 + 추적 모드의 속도와 박스 drift 비교"""
+    # 기준: 매 프레임 검출 + 주석
+    baseline = []
+    start = time.perf_counter()
+    for index in range(0, len(frames), batch_size):
+        batch = [frame.copy() for frame in frames[index:index + batch_size]]
+        detections = app.detect_batch(batch)
+        for frame, frame_detections in zip(batch, detections):
+            app.annotate(frame, frame_detections)
+        baseline.extend(detections)
+    baseline_seconds = time.perf_counter() - start
+
+    # 시간적 일관성 모드: k프레임마다(또는 장면 변화 시) 검출 + 추적 + 주석
+    temporal = app.TemporalDetector(detect_every)
+    tracked = []
+    start = time.perf_counter()
+    for index in range(0, len(frames), batch_size):
+        batch = [frame.copy() for frame in frames[index:index + batch_size]]
+        detections = app.track_batch(batch, temporal)
+        for frame, frame_detections in zip(batch, detections):
+            app.annotate(frame, frame_detections, labels=app.track_labels(frame_detections))
+        tracked.extend(detections)
+    temporal_seconds = time.perf_counter() - start
+
+    # drift: 기준 검출 중 같은 클래스 IoU >= 임계값인 박스가 없는 것
+    reference_total, candidate_total, matched_total, ious = 0, 0, 0, []
+    for reference, candidate in zip(baseline, tracked):
+        matched, matched_ious = match_detections(reference, candidate, iou_threshold)
+        reference_total += len(reference)
+        candidate_total += len(candidate)
+        matched_total += matched
+        ious.extend(matched_ious)
+
+    return {
+        "detect_every": detect_every,
+        "frames": len(frames),
+        "detector_runs": temporal.detector_runs,
+        "scene_changes": temporal.scene_changes,
+        "baseline_fps": len(frames) / baseline_seconds,
+        "temporal_fps": len(frames) / temporal_seconds,
+        "speedup": baseline_seconds / temporal_seconds,
+        "baseline_detections": reference_total,
+        "temporal_detections": candidate_total,
+        "drifted_detections": reference_total - matched_total,
+        "drift_rate": (reference_total - matched_total) / reference_total if reference_total else 0.0,
+        "spurious_detections": candidate_total - matched_total,
+        "mean_matched_iou": float(np.mean(ious)) if ious else None,
+        "iou_threshold": iou_threshold,
+    }
+
+def print_temporal_report(report):
+    print(f"\n⏱️ 매 프레임 검출 vs {report['detect_every']}프레임마다 검출 + 추적")
+    print(f"   검출기 실행: {report['detector_runs']}/{report['frames']} 프레임 (장면 변화 {report['scene_changes']}회)")
+    print(f"   처리량: {report['baseline_fps']:.2f} -> {report['temporal_fps']:.2f} fps ({report['speedup']:.2f}x)")
+    print(f"   drift: 기준 박스 {report['baseline_detections']}개 중 {report['drifted_detections']}개 불일치 "
+          f"({report['drift_rate']:.1%}, IoU < {report['iou_threshold']})")
+    mean_iou = "-" if report["mean_matched_iou"] is None else f"{report['mean_matched_iou']:.3f}"
+    print(f"   추가로 생긴 박스: {report['spurious_detections']}개, 매칭 박스 평균 IoU: {mean_iou}")
+
+def read_video_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def run_chunk_scaling(app, video_path, worker_counts, detect_every):
+    """전체 업로드 처리 시간: 순차 처리 vs 워커 수별 구간 병렬 처리
+
+    구간 경계에서 프레임이 빠지거나 겹치지 않는지 출력 프레임 수를 비교하고, 순차 처리 결과와의
+    프레임별 평균 픽셀 차이(인코딩 차이 + 박스 차이)를 함께 기록한다.
+    """
+    work_dir = tempfile.mkdtemp(prefix="bench_chunks_")
+    sequential_path = os.path.join(work_dir, "sequential.mp4")
+    start = time.perf_counter()
+    app.process_video(video_path, sequential_path, detect_every)
+    sequential_seconds = time.perf_counter() - start
+    sequential_frames = read_video_frames(sequential_path)
+
+    results = []
+    for workers in worker_counts:
+        pool = app.create_chunk_pool(workers)
+        # 워커 프로세스 시작 + 모델 로드(initializer)는 서버에서 한 번만 일어나므로 측정에서 제외
+        list(pool.map(time.sleep, [0.5] * workers))
+
+        output_path = os.path.join(work_dir, f"chunked_{workers}.mp4")
+        start = time.perf_counter()
+        stats = app.process_video_chunked(video_path, output_path, detect_every, pool=pool, workers=workers)
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+
+        chunked_frames = read_video_frames(output_path)
+        differences = [
+            float(np.abs(a.astype(np.int16) - b.astype(np.int16)).mean())
+            for a, b in zip(sequential_frames, chunked_frames)
+        ]
+        results.append({
+            "workers": workers,
+            "chunks": stats.get("chunks", 1),
+            "seconds": elapsed,
+            "fps": len(chunked_frames) / elapsed,
+            "speedup": sequential_seconds / elapsed,
+            "frames": len(chunked_frames),
+            "frames_match": len(chunked_frames) == len(sequential_frames),
+            "mean_pixel_diff": float(np.mean(differences)) if differences else None,
+            "max_pixel_diff": max(differences) if differences else None,
+        })
+
+    return {
+        "detect_every": detect_every,
+        "cpu_count": os.cpu_count(),
+        "sequential_seconds": sequential_seconds,
+        "sequential_frames": len(sequential_frames),
+        "results": results,
+        "output_dir": work_dir,
+    }
+
+def print_chunk_scaling(report):
+    print(f"\n🧩 구간 병렬 처리 (CPU {report['cpu_count']}개, 순차 {report['sequential_seconds']:.1f}s / {report['sequential_frames']} 프레임)")
+    print(f"   {'workers':>7} {'chunks':>6} {'seconds':>8} {'fps':>7} {'speedup':>8} {'frames':>7} {'max diff':>9}")
+    for result in report["results"]:
+        frames = f"{result['frames']}" + ("" if result["frames_match"] else " ❌")
+        max_diff = "-" if result["max_pixel_diff"] is None else f"{result['max_pixel_diff']:.2f}"
+        print(f"   {result['workers']:>7} {result['chunks']:>6} {result['seconds']:>8.1f} {result['fps']:>7.1f} "
+              f"{result['speedup']:>7.2f}x {frames:>7} {max_diff:>9}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video", help="측정에 사용할 동영상 (없으면 합성 프레임)")
+    parser.add_argument("--weights", help="YOLO 가중치 경로 (YOLO_MODEL_PATH)")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--temporal", type=int, metavar="K", help="K프레임마다 검출 모드 리포트 (매 프레임 검출과 비교)")
+    parser.add_argument("--batch", type=int, default=8, help="--temporal 리포트에서 사용할 배치 크기")
+    parser.add_argument("--iou", type=float, default=0.5, help="drift 판정 IoU 임계값")
+    parser.add_argument("--chunk-workers", type=int, nargs="+", help="구간 병렬 처리 워커 수 목록 (--video 필요)")
+    parser.add_argument("--detect-every", type=int, default=1, help="--chunk-workers 측정에서 사용할 DETECT_EVERY")
+    parser.add_argument("--json", help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    # 서버 모듈이 import 시점에 모델을 로드하므로 경로를 먼저 지정
+    if args.weights:
+        os.environ["YOLO_MODEL_PATH"] = args.weights
+    import app_video_FFmpeg as app
+    # 모델 로드 시간은 측정에서 제외
+    app.model_registry.pool()
+
+    if args.chunk_workers:
+        if not args.video:
+            raise SystemExit("--chunk-workers에는 --video가 필요합니다")
+        report = run_chunk_scaling(app, args.video, args.chunk_workers, args.detect_every)
+        print_chunk_scaling(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"💾 결과 저장: {args.json}")
+        return
+
+    frames = load_frames(args.video, args.frames) if args.video else make_synthetic_frames(args.frames)
+    if not frames:
+        raise SystemExit("프레임을 읽을 수 없습니다")
+    height, width = frames[0].shape[:2]
+
+    print(f"🎞️ {len(frames)} 프레임 ({width}x{height})")
+
+    if args.temporal:
+        report = run_temporal_report(app, frames, args.temporal, args.batch, args.iou)
+        print_temporal_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"💾 결과 저장: {args.json}")
+        return
+
+    print(f"   {'batch':>5} {'fps':>8} {'ms/frame':>9} {'speedup':>8}")
+    results = []
+    for batch_size in args.batch_sizes:
+        result = run_batch_size(app.annotate_batch, frames, batch_size, args.warmup)
+        results.append(result)
+        speedup = result["fps"] / results[0]["fps"]
+        print(f"   {batch_size:>5} {result['fps']:>8.2f} {result['ms_per_frame']:>9.1f} {speedup:>7.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"width": width, "height": height, "results": results}, f, indent=2)
+        print(f"💾 결과 저장: {args.json}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,3 +1,84 @@
+const POLL_INTERVAL_MS = 1000;
+let currentJobId = null;
+
+function formatSeconds(seconds) {
+    if (seconds === null || seconds === undefined) {
+        return '-';
+    }
+    const minutes = Math.floor(seconds / 60);
+    const rest = Math.round(seconds % 60);
+    return minutes > 0 ? `${minutes}분 ${rest}초` : `${rest}초`;
+}
+
+function showProgress(job) {
+    const progressElement = document.getElementById('progress');
+    const progressText = document.getElementById('progress-text');
+    const progressBar = document.getElementById('progress-bar');
+
+    progressElement.classList.remove('hidden');
+    if (job.status === 'queued') {
+        progressText.textContent = '대기 중...';
+        progressBar.value = 0;
+        return;
+    }
+
+    const total = job.total_frames ? ` / ${job.total_frames}` : '';
+    progressText.textContent = `처리 중: ${job.frames_done}${total} 프레임 (남은 시간 ${formatSeconds(job.eta_seconds)})`;
+    progressBar.value = job.progress ? job.progress * 100 : 0;
+}
+
+function showVideo(videoPath) {
+    const resultElement = document.getElementById('result');
+    const videoElement = document.getElementById('uploaded-video');
+
+    // 동영상 표시
+    videoElement.src = videoPath;
+    videoElement.load();
+    videoElement.style.display = 'block'; // Ensure the video element is visible
+    videoElement.controls = true; // Ensure controls are enabled
+
+    resultElement.classList.remove('hidden');
+}
+
+async function pollJob(jobId) {
+    while (currentJobId === jobId) {
+        const response = await fetch(`/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error('Network response was not ok');
+        }
+        const job = await response.json();
+
+        if (job.status === 'done') {
+            document.getElementById('progress').classList.add('hidden');
+            showVideo(job.video_path);
+            return;
+        }
+        if (job.status === 'failed') {
+            document.getElementById('progress').classList.add('hidden');
+            alert(job.error || '오류가 발생했습니다. 다시 시도해주세요.');
+            return;
+        }
+        if (job.status === 'cancelled') {
+            document.getElementById('progress-text').textContent = '취소되었습니다.';
+            return;
+        }
+
+        showProgress(job);
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    }
+}
+
+document.getElementById('cancel-button').addEventListener('click', async () => {
+    if (!currentJobId) {
+        return;
+    }
+    try {
+        await fetch(`/jobs/${currentJobId}/cancel`, { method: 'POST' });
+    } catch (error) {
+        console.error('Error:', error);
+    }
+});
+
 document.getElementById('upload-form').addEventListener('submit', async (e) => {
     e.preventDefault();
 
@@ -13,15 +94,12 @@ document.getElementById('upload-form').addEventListener('submit', async (e) => {
     formData.append('file', file);
 
     try {
+        // 업로드는 바로 job ID를 반환하고 처리는 서버 백그라운드에서 진행
         const response = await fetch('/detect', {
             method: 'POST',
             body: formData
         });
 
-        if (!response.ok) {
-            throw new Error('Network response was not ok');
-        }
-
         const result = await response.json();
 
         if (result.error) {
@@ -29,18 +107,14 @@ document.getElementById('upload-form').addEventListener('submit', async (e) => {
             return;
         }
 
-        console.log(result);
-
-        const resultElement = document.getElementById('result');
-        const videoElement = document.getElementById('uploaded-video');
-
-        // 동영상 표시
-        videoElement.src = result.video_path;
-        videoElement.load();
-        videoElement.style.display = 'block'; // Ensure the video element is visible
-        videoElement.controls = true; // Ensure controls are enabled
+        if (!response.ok) {
+            throw new Error('Network response was not ok');
+        }
 
-        resultElement.classList.remove('hidden');
+        document.getElementById('result').classList.add('hidden');
+        currentJobId = result.job_id;
+        showProgress(result);
+        await pollJob(result.job_id);
     } catch (error) {
         console.error('Error:', error);
         alert('오류가 발생했습니다. 다시 시도해주세요.');
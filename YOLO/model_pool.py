@@ -0,0 +1,206 @@
+"""YOLO 모델 레지스트리 + 인스턴스 풀 (이미지 / 동영상 앱 공용)
+
+설정 (나중 것이 앞의 값을 덮어씀):
+    1. 앱의 기본 가중치 경로
+    2. MODEL_CONFIG 환경 변수가 가리키는 JSON 파일
+       {"weights": "best.pt", "device": "cpu", "instances": 2, "class_names": ["Mask", "can", ...]}
+       (class_names는 가중치의 클래스 수와 같아야 함 - 이미지 앱의 models.example.json 참고)
+       또는 여러 모델: {"default": "custom", "models": {"custom": {...}, "pretrained": {...}}}
+    3. 기본 모델에 대한 환경 변수: YOLO_MODEL_PATH, YOLO_DEVICE, MODEL_INSTANCES,
+       YOLO_CLASS_NAMES (쉼표 구분)
+
+모델 인스턴스는 스레드 안전하지 않으므로 요청은 풀에서 인스턴스를 빌려(checkout) 쓰고 돌려준다.
+동시 요청 N개는 인스턴스 N개에서 동시에 돌고, 그 이상은 반납을 기다린다.
+/pool/stats의 대기 시간과 사용률을 보고 MODEL_INSTANCES를 코어 수에 맞게 정한다.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# 대기 시간 분위수 계산에 쓰는 최근 checkout 수
+WAIT_HISTORY_SIZE = 1000
+
+def load_model_configs(default_weights):
+    """(기본 모델 이름, {이름: 설정}) - 파일 설정 위에 환경 변수를 덮어씀"""
+    default_name = 'default'
+    configs = {default_name: {'weights': default_weights}}
+
+    config_path = os.environ.get('MODEL_CONFIG')
+    if config_path:
+        with open(config_path) as f:
+            data = json.load(f)
+        if 'models' in data:
+            configs = {name: dict(config) for name, config in data['models'].items()}
+            default_name = data.get('default', next(iter(configs)))
+        else:
+            configs[default_name].update(data)
+
+    config = configs[default_name]
+    if os.environ.get('YOLO_MODEL_PATH'):
+        config['weights'] = os.environ['YOLO_MODEL_PATH']
+    if os.environ.get('YOLO_DEVICE'):
+        config['device'] = os.environ['YOLO_DEVICE']
+    if os.environ.get('MODEL_INSTANCES'):
+        config['instances'] = int(os.environ['MODEL_INSTANCES'])
+    if os.environ.get('YOLO_CLASS_NAMES'):
+        config['class_names'] = [name.strip() for name in os.environ['YOLO_CLASS_NAMES'].split(',')]
+
+    for name, config in configs.items():
+        if not config.get('weights'):
+            raise ValueError(f'모델 설정 "{name}"에 weights가 없습니다')
+    return default_name, configs
+
+class ModelPool:
+    """같은 가중치로 만든 모델 인스턴스 N개 - 한 번에 한 요청만 쓰도록 빌려주고 돌려받음"""
+
+    def __init__(self, name, factory, weights, device=None, instances=1, class_names=None):
+        self.name = name
+        self.weights = weights
+        self.device = device
+        self.size = max(1, int(instances))
+
+        self.models = []
+        for _ in range(self.size):
+            model = factory(weights)
+            if class_names:
+                if len(class_names) != len(model.names):
+                    raise ValueError(f'class_names는 {len(model.names)}개여야 합니다 ({weights}): {len(class_names)}개')
+                # 결과의 class_name / 라벨에 쓰이는 이름을 설정 값으로 바꿈
+                model.model.names = dict(enumerate(class_names))
+            self.models.append(model)
+        self.names = dict(self.models[0].names)
+
+        self.available = queue.Queue()
+        for model in self.models:
+            self.available.put(model)
+
+        self.lock = threading.Lock()
+        self.created_at = time.perf_counter()
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.waited_checkouts = 0
+        self.busy_seconds = 0.0
+        self.wait_history = deque(maxlen=WAIT_HISTORY_SIZE)
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """with pool.checkout() as model: ... - 쉬는 인스턴스가 없으면 반납될 때까지 대기
+
+        timeout이 지나면 queue.Empty 발생
+        """
+        started = time.perf_counter()
+        with self.lock:
+            self.waiting += 1
+        try:
+            model = self.available.get(timeout=timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+        acquired = time.perf_counter()
+        wait = acquired - started
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            # 1ms 이상 기다렸으면 인스턴스가 모자랐던 것으로 봄
+            if wait > 0.001:
+                self.waited_checkouts += 1
+            self.wait_history.append(wait)
+        try:
+            yield model
+        finally:
+            with self.lock:
+                self.in_use -= 1
+                self.busy_seconds += time.perf_counter() - acquired
+            self.available.put(model)
+
+    def predict(self, source, **kwargs):
+        """인스턴스를 빌려 model(source, **kwargs) 실행 (설정된 device 적용)"""
+        if self.device is not None:
+            kwargs.setdefault('device', self.device)
+        with self.checkout() as model:
+            return model(source, **kwargs)
+
+    def stats(self):
+        with self.lock:
+            waits = np.array(self.wait_history) * 1000
+            elapsed = time.perf_counter() - self.created_at
+            busy_seconds = self.busy_seconds
+            return {
+                'name': self.name,
+                'weights': self.weights,
+                'device': self.device,
+                'instances': self.size,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'checkouts': self.checkouts,
+                # 기다려야 했던 checkout 비율 - 높으면 인스턴스가 부족
+                'waited_ratio': self.waited_checkouts / self.checkouts if self.checkouts else 0.0,
+                'wait_ms': {
+                    'p50': float(np.percentile(waits, 50)) if waits.size else None,
+                    'p95': float(np.percentile(waits, 95)) if waits.size else None,
+                    'max': float(waits.max()) if waits.size else None,
+                },
+                # 풀이 만들어진 뒤 인스턴스들이 일한 시간 비율 (0~1)
+                'utilization': busy_seconds / (elapsed * self.size) if elapsed > 0 else 0.0,
+            }
+
+class ModelRegistry:
+    """이름 -> 모델 설정 / 풀 (풀은 처음 쓸 때 생성)"""
+
+    def __init__(self, factory, default_name, configs):
+        self.factory = factory
+        self.default_name = default_name
+        self.configs = configs
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls, factory, default_weights):
+        default_name, configs = load_model_configs(default_weights)
+        return cls(factory, default_name, configs)
+
+    def configure(self, name=None, **overrides):
+        """풀이 만들어지기 전에 설정 변경 (예: 워커 프로세스에서 instances=1)"""
+        name = name or self.default_name
+        with self.lock:
+            if name in self.pools:
+                raise RuntimeError(f'모델 "{name}"은 이미 로드되었습니다')
+            self.configs[name].update(overrides)
+
+    def pool(self, name=None):
+        name = name or self.default_name
+        with self.lock:
+            if name not in self.pools:
+                if name not in self.configs:
+                    raise KeyError(f'등록되지 않은 모델: {name}')
+                config = self.configs[name]
+                started = time.perf_counter()
+                self.pools[name] = ModelPool(
+                    name,
+                    self.factory,
+                    config['weights'],
+                    device=config.get('device'),
+                    instances=config.get('instances', 1),
+                    class_names=config.get('class_names'),
+                )
+                print(f"✅ 모델 로드: {name} ({config['weights']}) x{self.pools[name].size} "
+                      f"- {time.perf_counter() - started:.1f}s")
+            return self.pools[name]
+
+    def stats(self):
+        with self.lock:
+            pools = list(self.pools.values())
+            configured = list(self.configs)
+        return {
+            'default': self.default_name,
+            'configured': configured,
+            'pools': [pool.stats() for pool in pools],
+        }